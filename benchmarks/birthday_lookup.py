@@ -0,0 +1,83 @@
+"""Times the scheduler's day-of-year birthday lookup against the old month/day scan.
+
+Fills a scratch database with BIRTHDAYS rows spread over GUILDS guilds,
+checks that both queries return the same members for a day, then times
+them. Run from the repository root:
+
+    python benchmarks/birthday_lookup.py [birthdays]
+"""
+import asyncio
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.getcwd())
+from database import Database
+from birthdays import BirthdayCog, _birthday_days, _day_of_year
+
+BIRTHDAYS = 500_000
+GUILDS = 2_000
+DAY = datetime.date(2025, 6, 14)
+ROUNDS = 200
+
+SCAN_QUERY = 'SELECT guild_id, user_id FROM birthdays WHERE month = ? AND day = ?'
+INDEXED_QUERY = 'SELECT guild_id, user_id FROM birthdays WHERE day_of_year BETWEEN ? AND ?'
+
+
+def fake_birthdays(count: int):
+    rng = random.Random(25)
+    for user_id in range(count):
+        day_of_year = rng.randrange(1, 367)
+        date = datetime.date(2000, 1, 1) + datetime.timedelta(days=day_of_year - 1)
+        yield rng.randrange(GUILDS), user_id, date.month, date.day, day_of_year
+
+
+async def fetch(db: Database, sql: str, params: tuple) -> set[tuple]:
+    async with db.execute(sql, params) as cursor:
+        return {tuple(row) for row in await cursor.fetchall()}
+
+
+async def timed(label: str, run) -> None:
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        await run()
+    print(f'  {label:<28} {(time.perf_counter() - started) / ROUNDS * 1000:8.3f}ms')
+
+
+async def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else BIRTHDAYS
+    with tempfile.TemporaryDirectory() as directory:
+        db = Database(os.path.join(directory, 'bench.db'))
+        await db.connect()
+        cog = BirthdayCog(types.SimpleNamespace(db=db))
+        cog.db = db
+        await cog._create_tables()
+
+        await db.write_many(
+            'INSERT OR REPLACE INTO birthdays (guild_id, user_id, month, day, day_of_year) VALUES (?, ?, ?, ?, ?)',
+            fake_birthdays(count)
+        )
+        await db.write('ANALYZE')
+        print(f'Inserted {count} birthdays across {GUILDS} guilds')
+
+        scan_params = (DAY.month, DAY.day)
+        indexed_params = _birthday_days(DAY)
+        assert indexed_params == (_day_of_year(DAY.month, DAY.day),) * 2
+        scanned = await fetch(db, SCAN_QUERY, scan_params)
+        indexed = await fetch(db, INDEXED_QUERY, indexed_params)
+        if scanned != indexed:
+            raise SystemExit(f'Lookups disagree: {len(scanned)} vs {len(indexed)} rows')
+        print(f'Both lookups return the same {len(indexed)} birthdays for {DAY}')
+
+        await timed('day_of_year covering index', lambda: fetch(db, INDEXED_QUERY, indexed_params))
+        await timed('month/day table scan', lambda: fetch(db, SCAN_QUERY, scan_params))
+
+        await db.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
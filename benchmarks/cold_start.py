@@ -0,0 +1,58 @@
+"""Measures what each cog costs to import in a fresh interpreter.
+
+This is the startup time and memory that IMPBOT_LAZY_COGS defers until the
+cog is first used. Run from the repository root:
+
+    python benchmarks/cold_start.py [cog ...]
+"""
+import os
+import subprocess
+import sys
+
+COGS = ['slash', 'events', 'birthdays', 'letterboxd', 'starboard', 'lpc']
+RUNS = 5
+
+# Imports discord.py first so the numbers only cover what the cog itself adds
+PROBE = '''
+import resource, sys, time
+import discord, discord.ext.commands, discord.ext.tasks
+before_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before_rss)
+'''
+
+
+def measure(module: str) -> tuple[float, float]:
+    env = dict(os.environ)
+    # lpc refuses to import without an album directory
+    env.setdefault('ALBUMS_PATH', os.getcwd())
+    timings = []
+    rss = []
+    for _ in range(RUNS):
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE.format(module=module)],
+            capture_output=True, text=True, env=env,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        seconds, rss_kb = result.stdout.split()
+        timings.append(float(seconds))
+        rss.append(int(rss_kb))
+    timings.sort()
+    return timings[len(timings) // 2], max(rss) / 1024
+
+
+def main() -> None:
+    for module in sys.argv[1:] or COGS:
+        try:
+            seconds, rss_mb = measure(module)
+        except RuntimeError as e:
+            print(f'{module:<12} failed: {e}')
+            continue
+        print(f'{module:<12} import {seconds * 1000:7.1f}ms   RSS +{rss_mb:5.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Compares DescriptionParts.parse with the extractors it replaced.
+
+Pass saved Letterboxd RSS files (https://letterboxd.com/<user>/rss/) to use
+their item descriptions as the corpus; without arguments a set of samples in
+Letterboxd's markup is used. Every description is first checked to give the
+same poster URL and review text as before. Run from the repository root:
+
+    python benchmarks/letterboxd_descriptions.py [feed.xml ...]
+"""
+import os
+import re
+import sys
+import timeit
+import xml.etree.ElementTree as ET
+from typing import Optional
+
+sys.path.insert(0, os.getcwd())
+from letterboxd import MAX_REVIEW_LENGTH, DescriptionParts
+
+ROUNDS = 2000
+
+POSTER = '<p><img src="https://a.ltrbxd.com/resized/film-poster/{0}/{0}-0-600-0-900-crop.jpg?v=8f3c2a"/></p> '
+SAMPLES = [
+    POSTER.format(51568) + '<p>Watched on Saturday March 1, 2025.</p>',
+    POSTER.format(426406) + '<p>Watched on Friday February 28, 2025.</p> <p>Rewatched with the commentary on. '
+    'Still the best use of a <b>single location</b> I can think of.</p>',
+    POSTER.format(8941) + '<p><em>This review may contain spoilers.</em></p> <p>The ending <i>completely</i> '
+    'recontextualises the first act and I need a week to think about it.</p> <p>Also the score rules.</p>',
+    POSTER.format(277064) + '<p>' + 'An extremely long review that keeps going and going. ' * 20 + '</p>',
+    POSTER.format(1025) + '<p>Watched on Tuesday January 7, 2025.</p> <p>Fine.</p> <p></p> '
+    '<p><a href="https://letterboxd.com/film/heat-1995/">Heat</a> did this better.</p>',
+    '<p>No poster on this one.</p>',
+]
+
+
+def legacy_poster_url(description: str) -> Optional[str]:
+    match = re.search(r'<img\s+src="([^"]+)"', description)
+    return match.group(1) if match else None
+
+
+def legacy_review_text(description: str) -> Optional[str]:
+    paragraphs = re.findall(r'<p>(.*?)</p>', description, re.DOTALL)
+
+    review_parts = []
+    for p in paragraphs:
+        if '<img' in p:
+            continue
+        if p.strip().startswith('Watched on'):
+            continue
+        clean = re.sub(r'<[^>]+>', '', p).strip()
+        if clean:
+            review_parts.append(clean)
+
+    review = '\n\n'.join(review_parts)
+    if not review:
+        return None
+
+    if len(review) > MAX_REVIEW_LENGTH:
+        review = review[:MAX_REVIEW_LENGTH].rsplit(' ', 1)[0] + '...'
+
+    return review
+
+
+def load_corpus(paths: list[str]) -> list[str]:
+    if not paths:
+        return SAMPLES
+    corpus = []
+    for path in paths:
+        root = ET.parse(path).getroot()
+        corpus.extend(item.findtext('description') or '' for item in root.iter('item'))
+    return corpus
+
+
+def main() -> None:
+    corpus = load_corpus(sys.argv[1:])
+
+    for description in corpus:
+        parts = DescriptionParts.parse(description)
+        expected = (legacy_poster_url(description), legacy_review_text(description))
+        if (parts.poster_url, parts.review_text) != expected:
+            raise SystemExit(f'Output differs for:\n{description}\n{expected!r}\n{(parts.poster_url, parts.review_text)!r}')
+    print(f'{len(corpus)} descriptions match the previous extractors')
+
+    def legacy() -> None:
+        for description in corpus:
+            legacy_poster_url(description)
+            legacy_review_text(description)
+
+    def single_pass() -> None:
+        for description in corpus:
+            DescriptionParts.parse(description)
+
+    for name, run in (('legacy', legacy), ('single pass', single_pass)):
+        seconds = min(timeit.repeat(run, number=ROUNDS, repeat=5))
+        per_item = seconds / (ROUNDS * len(corpus)) * 1e6
+        print(f'{name:<12} {per_item:6.2f}us per description')
+
+
+if __name__ == '__main__':
+    main()
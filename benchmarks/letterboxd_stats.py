@@ -0,0 +1,115 @@
+"""Times /letterboxd stats against the same leaderboards computed from raw entries.
+
+Fills a scratch database with ENTRIES diary entries through the cog's own
+batched insert path (so the aggregate triggers run), checks that the
+aggregate tables agree with GROUP BY scans over letterboxd_entries, then
+times both. Run from the repository root:
+
+    python benchmarks/letterboxd_stats.py [entries]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.getcwd())
+from database import Database
+from letterboxd import STATS_LIMIT, STATS_MIN_RATED, LetterboxdCog
+
+ENTRIES = 100_000
+MEMBERS = 60
+FILMS = 8_000
+GUILD_ID = 1
+MONTH = '2024-06'
+ROUNDS = 200
+
+SCAN_QUERIES = {
+    'monthly': (
+        'SELECT user_id, COUNT(*) AS films FROM letterboxd_entries '
+        'WHERE guild_id = ? AND substr(watched_date, 1, 7) = ? GROUP BY user_id ORDER BY films DESC LIMIT ?',
+        (GUILD_ID, MONTH, STATS_LIMIT),
+    ),
+    'ratings': (
+        'SELECT user_id, AVG(rating) AS average, COUNT(rating) AS rated FROM letterboxd_entries '
+        'WHERE guild_id = ? GROUP BY user_id HAVING rated >= ? ORDER BY average DESC LIMIT ?',
+        (GUILD_ID, STATS_MIN_RATED, STATS_LIMIT),
+    ),
+    'films': (
+        'SELECT film_title, film_year, COUNT(*) AS watches FROM letterboxd_entries '
+        'WHERE guild_id = ? GROUP BY film_title, film_year ORDER BY watches DESC LIMIT ?',
+        (GUILD_ID, STATS_LIMIT),
+    ),
+}
+
+
+def fake_entries(count: int):
+    rng = random.Random(23)
+    # Skewed so there are clear leaders, like a real server
+    weights = [1 / (rank + 1) for rank in range(FILMS)]
+    films = rng.choices(range(FILMS), weights=weights, k=count)
+    for n, film in enumerate(films):
+        day = n % 28 + 1
+        month = n // (count // 36 + 1) % 12 + 1
+        year = 2022 + n * 3 // count
+        rating = rng.choice([None, 1.0, 2.5, 3.0, 3.5, 4.0, 4.5, 5.0])
+        entry = (f'Film {film}', 1950 + film % 70, f'{year}-{month:02d}-{day:02d}', rating, False, False, None)
+        yield rng.randrange(MEMBERS), entry
+
+
+async def scan(db: Database, name: str) -> list[tuple]:
+    sql, params = SCAN_QUERIES[name]
+    async with db.execute(sql, params) as cursor:
+        return [tuple(row) for row in await cursor.fetchall()]
+
+
+async def timed(label: str, run) -> None:
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        await run()
+    print(f'  {label:<28} {(time.perf_counter() - started) / ROUNDS * 1000:8.3f}ms')
+
+
+async def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else ENTRIES
+    with tempfile.TemporaryDirectory() as directory:
+        db = Database(os.path.join(directory, 'bench.db'))
+        await db.connect()
+        cog = LetterboxdCog(types.SimpleNamespace(db=db))
+        cog.db = db
+        await cog._create_tables()
+
+        by_member: dict[int, list[tuple]] = {}
+        for user_id, entry in fake_entries(count):
+            by_member.setdefault(user_id, []).append(entry)
+        started = time.perf_counter()
+        inserted = 0
+        for user_id, entries in by_member.items():
+            inserted += await cog._store_entries(GUILD_ID, user_id, entries, 'csv')
+        print(f'Inserted {inserted} entries with aggregate triggers in {time.perf_counter() - started:.2f}s')
+
+        aggregates = {
+            'monthly': lambda: cog._top_monthly_loggers(GUILD_ID, MONTH),
+            'ratings': lambda: cog._top_average_ratings(GUILD_ID),
+            'films': lambda: cog._most_watched_films(GUILD_ID),
+        }
+        for name, query in aggregates.items():
+            from_aggregate = [tuple(row) for row in await query()]
+            from_scan = await scan(db, name)
+            # Ties can come back in either order, so compare the values that were ranked
+            if [row[-1] for row in from_aggregate] != [row[-1] for row in from_scan]:
+                raise SystemExit(f'{name} disagrees:\n{from_aggregate}\n{from_scan}')
+        print('Aggregates match GROUP BY scans of letterboxd_entries')
+
+        for name, query in aggregates.items():
+            print(name)
+            await timed('aggregate table', query)
+            await timed('scan of entries', lambda name=name: scan(db, name))
+
+        await db.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,66 +1,129 @@
+import asyncio
 import datetime
 import calendar
-import aiosqlite
+import functools
+import heapq
+import time
 import discord
 from discord import app_commands
-from discord.ext import commands, tasks
+from discord.ext import commands
 from typing import Optional, List
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError, available_timezones
+
+from database import Database, GuildSettingsCache
 
-DB_PATH = "impbot.db"
 BIRTHDAY_EMBED_COLOR = discord.Color.from_rgb(255, 172, 51)
+DEFAULT_TIMEZONE = 'UTC'
+MAX_SCHEDULER_SLEEP = 3600  # re-read the wall clock at least this often
+
+
+def _day_of_year(month: int, day: int) -> int:
+    # Numbered in a leap year so February 29 has a slot of its own
+    return datetime.date(2000, month, day).timetuple().tm_yday
+
+
+def _birthday_days(date: datetime.date) -> tuple[int, int]:
+    """Returns the inclusive day_of_year range to announce on a local date."""
+    first = _day_of_year(date.month, date.day)
+    if date.month == 2 and date.day == 28 and not calendar.isleap(date.year):
+        # February 29 birthdays are celebrated on the 28th in common years
+        return first, first + 1
+    return first, first
+
+
+@functools.cache
+def _timezone_names() -> list[str]:
+    return sorted(available_timezones())
+
+
+def _next_midnight(timezone: str, now: float) -> tuple[float, datetime.date]:
+    """Returns the UTC timestamp of the next local midnight in timezone, and the date it starts."""
+    zone = ZoneInfo(timezone)
+    local_date = datetime.datetime.fromtimestamp(now, zone).date() + datetime.timedelta(days=1)
+    return datetime.datetime.combine(local_date, datetime.time(), tzinfo=zone).timestamp(), local_date
+
 
 class BirthdayCog(commands.Cog):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
-        self.db: aiosqlite.Connection = None  # type: ignore[assignment]
+        self.db: Database = None  # type: ignore[assignment]
+        self.channels: GuildSettingsCache = None  # type: ignore[assignment]
+        self.timezones: GuildSettingsCache = None  # type: ignore[assignment]
+        # Heap of (fire at, timezone, local date), one entry per timezone in use
+        self._schedule: list[tuple[float, str, datetime.date]] = []
+        self._scheduled_zones: set[str] = set()
+        self._schedule_changed = asyncio.Event()
+        self._scheduler_task: Optional[asyncio.Task] = None
 
     birthday_group = app_commands.Group(name='birthday', description='Birthday commands')
 
     async def cog_load(self) -> None:
-        self.db = await aiosqlite.connect(DB_PATH)
-        self.db.row_factory = aiosqlite.Row
+        self.db = self.bot.db
         await self._create_tables()
-        self.birthday_check_task.start()
+        self.channels = GuildSettingsCache(self.db, 'birthday_channels', ('channel_id',))
+        self.timezones = GuildSettingsCache(self.db, 'birthday_timezones', ('timezone',))
+        await asyncio.gather(self.channels.load(), self.timezones.load())
+        for timezone in self._active_timezones():
+            self._schedule_timezone(timezone)
+        self._scheduler_task = asyncio.create_task(self._birthday_scheduler())
 
     async def cog_unload(self) -> None:
-        self.birthday_check_task.cancel()
-        if self.db:
-            await self.db.close()
+        if self._scheduler_task:
+            self._scheduler_task.cancel()
 
     async def _create_tables(self) -> None:
-        await self.db.execute('''
-            CREATE TABLE IF NOT EXISTS birthdays (
-                guild_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                month INTEGER NOT NULL,
-                day INTEGER NOT NULL,
-                PRIMARY KEY (guild_id, user_id)
-            )
-        ''')
-        await self.db.execute('''
-            CREATE TABLE IF NOT EXISTS birthday_channels (
-                guild_id INTEGER PRIMARY KEY,
-                channel_id INTEGER NOT NULL
+        await self.db.create_tables(
+            '''
+                CREATE TABLE IF NOT EXISTS birthdays (
+                    guild_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    month INTEGER NOT NULL,
+                    day INTEGER NOT NULL,
+                    day_of_year INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (guild_id, user_id)
+                )
+            ''',
+            '''
+                CREATE TABLE IF NOT EXISTS birthday_channels (
+                    guild_id INTEGER PRIMARY KEY,
+                    channel_id INTEGER NOT NULL
+                )
+            ''',
+            '''
+                CREATE TABLE IF NOT EXISTS birthday_timezones (
+                    guild_id INTEGER PRIMARY KEY,
+                    timezone TEXT NOT NULL
+                )
+            ''',
+        )
+
+        async with self.db.execute('PRAGMA table_info(birthdays)') as cursor:
+            columns = {row['name'] for row in await cursor.fetchall()}
+        if 'day_of_year' not in columns:
+            print('[BIRTHDAY] Adding day_of_year to the birthdays table')
+            await self.db.create_tables(
+                'ALTER TABLE birthdays ADD COLUMN day_of_year INTEGER NOT NULL DEFAULT 0',
+                '''
+                    UPDATE birthdays
+                    SET day_of_year = CAST(strftime('%j', printf('2000-%02d-%02d', month, day)) AS INTEGER)
+                ''',
             )
-        ''')
-        await self.db.commit()
 
-    async def _get_birthday_channel(self, guild: discord.Guild) -> Optional[discord.TextChannel]:
-        async with self.db.execute(
-            'SELECT channel_id FROM birthday_channels WHERE guild_id = ?',
-            (guild.id,)
-        ) as cursor:
-            row = await cursor.fetchone()
+        # Covers the scheduler's lookup, so it never reads the table itself
+        await self.db.create_tables(
+            '''
+                CREATE INDEX IF NOT EXISTS idx_birthdays_day_of_year
+                ON birthdays (day_of_year, guild_id, user_id)
+            ''',
+        )
 
-        if row:
-            channel = guild.get_channel(row['channel_id'])
+    async def _get_birthday_channel(self, guild: discord.Guild) -> Optional[discord.TextChannel]:
+        settings = self.channels.get(guild.id)
+        if settings:
+            channel = guild.get_channel(settings['channel_id'])
             if isinstance(channel, discord.TextChannel):
                 return channel
-            await self.db.execute(
-                'DELETE FROM birthday_channels WHERE guild_id = ?',
-                (guild.id,)
-            )
-            await self.db.commit()
+            await self.channels.delete(guild.id)
 
         return guild.system_channel
 
@@ -75,40 +138,102 @@ class BirthdayCog(commands.Cog):
         embed.set_footer(text='Imp Bot 10000')
         return embed
 
-    @tasks.loop(time=datetime.time(hour=0, minute=0, tzinfo=datetime.timezone.utc))
-    async def birthday_check_task(self) -> None:
+    def _guild_timezone(self, guild_id: int) -> str:
+        settings = self.timezones.get(guild_id)
+        return settings['timezone'] if settings else DEFAULT_TIMEZONE
+
+    def _active_timezones(self) -> set[str]:
+        return {DEFAULT_TIMEZONE} | {settings['timezone'] for _, settings in self.timezones.items()}
+
+    def _schedule_timezone(self, timezone: str) -> None:
+        if timezone in self._scheduled_zones:
+            return
+        fire_at, local_date = _next_midnight(timezone, time.time())
+        heapq.heappush(self._schedule, (fire_at, timezone, local_date))
+        self._scheduled_zones.add(timezone)
+        self._schedule_changed.set()
+
+    async def _birthday_scheduler(self) -> None:
         await self.bot.wait_until_ready()
 
-        today = datetime.datetime.now(datetime.timezone.utc)
+        while True:
+            self._schedule_changed.clear()
+            fire_at, timezone, local_date = self._schedule[0]
+            delay = fire_at - time.time()
+            if delay > 0:
+                # Woken early when a new timezone lands at the top of the heap
+                try:
+                    await asyncio.wait_for(self._schedule_changed.wait(), timeout=min(delay, MAX_SCHEDULER_SLEEP))
+                except asyncio.TimeoutError:
+                    pass
+                continue
 
-        async with self.db.execute(
-            'SELECT guild_id, user_id FROM birthdays WHERE month = ? AND day = ?',
-            (today.month, today.day)
-        ) as cursor:
-            rows = await cursor.fetchall()
+            heapq.heappop(self._schedule)
+            self._scheduled_zones.discard(timezone)
+            if timezone not in self._active_timezones():
+                continue
+            self._schedule_timezone(timezone)
 
+            try:
+                await self._check_birthdays(timezone, local_date)
+            except Exception as e:
+                print(f'[BIRTHDAY] Birthday check for {timezone} on {local_date} failed: {e}')
+
+    async def _check_birthdays(self, timezone: str, local_date: datetime.date) -> None:
+        first, last = _birthday_days(local_date)
+
+        if timezone == DEFAULT_TIMEZONE:
+            async with self.db.execute(
+                'SELECT guild_id, user_id FROM birthdays WHERE day_of_year BETWEEN ? AND ?',
+                (first, last)
+            ) as cursor:
+                rows = await cursor.fetchall()
+            # Guilds with a timezone of their own are announced at their own midnight
+            rows = [row for row in rows if self._guild_timezone(row['guild_id']) == DEFAULT_TIMEZONE]
+        else:
+            guild_ids = [guild_id for guild_id, settings in self.timezones.items() if settings['timezone'] == timezone]
+            if not guild_ids:
+                return
+            async with self.db.execute(
+                'SELECT guild_id, user_id FROM birthdays WHERE day_of_year BETWEEN ? AND ? '
+                f'AND guild_id IN ({", ".join("?" for _ in guild_ids)})',
+                (first, last, *guild_ids)
+            ) as cursor:
+                rows = await cursor.fetchall()
+
+        wanted: dict[int, list[int]] = {}
         for row in rows:
-            guild = self.bot.get_guild(row['guild_id'])
+            wanted.setdefault(row['guild_id'], []).append(row['user_id'])
+
+        announcements = []
+        for guild_id, user_ids in wanted.items():
+            guild = self.bot.get_guild(guild_id)
             if not guild:
                 continue
 
-            member = guild.get_member(row['user_id'])
-            if not member:
-                continue
+            members = await self.bot.get_or_query_members(guild, user_ids)
+            for user_id in user_ids:
+                member = members.get(user_id)
+                if member:
+                    announcements.append(self._announce_birthday(guild, member, local_date))
 
-            channel = await self._get_birthday_channel(guild)
-            if not channel:
-                print(f'[BIRTHDAY] No birthday channel available for guild {guild.name} [{guild.id}]')
-                continue
+        # Queued together so they share one database commit instead of waiting on one each
+        await asyncio.gather(*announcements)
 
-            try:
-                embed = self._build_birthday_embed(member)
-                await channel.send(embed=embed)
-                print(f'[BIRTHDAY] Sent birthday message for {member.display_name} in {guild.name}')
-            except discord.Forbidden:
-                print(f'[BIRTHDAY] Missing permissions to send in {channel.name} [{guild.name}]')
-            except discord.HTTPException as e:
-                print(f'[BIRTHDAY] Failed to send birthday message: {e}')
+    async def _announce_birthday(self, guild: discord.Guild, member: discord.Member, local_date: datetime.date) -> None:
+
+        channel = await self._get_birthday_channel(guild)
+        if not channel:
+            print(f'[BIRTHDAY] No birthday channel available for guild {guild.name} [{guild.id}]')
+            return
+
+        queued = await self.bot.dispatcher.enqueue(
+            channel,
+            embed=self._build_birthday_embed(member),
+            dedup_key=f'birthday:{guild.id}:{member.id}:{local_date.isoformat()}',
+        )
+        if queued:
+            print(f'[BIRTHDAY] Queued birthday message for {member.display_name} in {guild.name}')
 
     @birthday_group.command(name='set', description='Set your birthday (month and day)')
     @app_commands.describe(month='Month', day='Day of the month (1-31)')
@@ -129,11 +254,10 @@ class BirthdayCog(commands.Cog):
             )
             return
 
-        await self.db.execute(
-            'INSERT OR REPLACE INTO birthdays (guild_id, user_id, month, day) VALUES (?, ?, ?, ?)',
-            (inter.guild.id, inter.user.id, month.value, day)
+        await self.db.write(
+            'INSERT OR REPLACE INTO birthdays (guild_id, user_id, month, day, day_of_year) VALUES (?, ?, ?, ?, ?)',
+            (inter.guild.id, inter.user.id, month.value, day, _day_of_year(month.value, day))
         )
-        await self.db.commit()
 
         await inter.response.send_message(
             f'Your birthday has been set to **{month.name} {day}**!',
@@ -146,13 +270,12 @@ class BirthdayCog(commands.Cog):
             await inter.response.send_message('This command can only be used in a server.', ephemeral=True)
             return
 
-        result = await self.db.execute(
+        deleted = await self.db.write(
             'DELETE FROM birthdays WHERE guild_id = ? AND user_id = ?',
             (inter.guild.id, inter.user.id)
         )
-        await self.db.commit()
 
-        if result.rowcount > 0:
+        if deleted > 0:
             await inter.response.send_message('Your birthday has been removed.', ephemeral=True)
         else:
             await inter.response.send_message('You don\'t have a birthday set in this server.', ephemeral=True)
@@ -199,21 +322,13 @@ class BirthdayCog(commands.Cog):
             return
 
         if channel:
-            await self.db.execute(
-                'INSERT OR REPLACE INTO birthday_channels (guild_id, channel_id) VALUES (?, ?)',
-                (inter.guild.id, channel.id)
-            )
-            await self.db.commit()
+            await self.channels.set(inter.guild.id, channel_id=channel.id)
             await inter.response.send_message(
                 f'Birthday announcements will now be sent to {channel.mention}.',
                 ephemeral=True
             )
         else:
-            await self.db.execute(
-                'DELETE FROM birthday_channels WHERE guild_id = ?',
-                (inter.guild.id,)
-            )
-            await self.db.commit()
+            await self.channels.delete(inter.guild.id)
             system_ch = inter.guild.system_channel
             if system_ch:
                 await inter.response.send_message(
@@ -227,6 +342,48 @@ class BirthdayCog(commands.Cog):
                     ephemeral=True
                 )
 
+    @birthday_group.command(name='timezone', description='Set the timezone birthdays are announced in (admin only)')
+    @app_commands.describe(timezone='An IANA timezone such as Europe/London (leave empty to reset to UTC)')
+    @app_commands.default_permissions(manage_guild=True)
+    async def birthday_timezone(self, inter: discord.Interaction, timezone: Optional[str] = None) -> None:
+        if not inter.guild:
+            await inter.response.send_message('This command can only be used in a server.', ephemeral=True)
+            return
+
+        if not timezone:
+            await self.timezones.delete(inter.guild.id)
+            await inter.response.send_message(
+                f'Birthday timezone reset. Birthdays will be announced at midnight {DEFAULT_TIMEZONE}.',
+                ephemeral=True
+            )
+            return
+
+        try:
+            ZoneInfo(timezone)
+        except (ZoneInfoNotFoundError, ValueError):
+            await inter.response.send_message(
+                f'`{timezone}` isn\'t a timezone I know. Pick one from the suggestions, like `America/New_York`.',
+                ephemeral=True
+            )
+            return
+
+        await self.timezones.set(inter.guild.id, timezone=timezone)
+        self._schedule_timezone(timezone)
+        await inter.response.send_message(
+            f'Birthdays will now be announced at midnight **{timezone}** time.',
+            ephemeral=True
+        )
+
+    @birthday_timezone.autocomplete('timezone')
+    async def timezone_autocomplete(
+        self,
+        interaction: discord.Interaction,
+        current: str
+    ) -> List[app_commands.Choice[str]]:
+        current = current.lower().replace(' ', '_')
+        matches = [name for name in _timezone_names() if current in name.lower()]
+        return [app_commands.Choice(name=name, value=name) for name in matches[:25]]
+
     @birthday_group.command(name='list', description='Show upcoming birthdays in this server')
     async def birthday_list(self, inter: discord.Interaction) -> None:
         if not inter.guild:
@@ -234,7 +391,7 @@ class BirthdayCog(commands.Cog):
             return
 
         async with self.db.execute(
-            'SELECT user_id, month, day FROM birthdays WHERE guild_id = ? ORDER BY month, day',
+            'SELECT user_id, month, day, day_of_year FROM birthdays WHERE guild_id = ? ORDER BY day_of_year',
             (inter.guild.id,)
         ) as cursor:
             rows = await cursor.fetchall()
@@ -243,17 +400,21 @@ class BirthdayCog(commands.Cog):
             await inter.response.send_message('No birthdays have been set in this server yet!', ephemeral=True)
             return
 
-        today = datetime.datetime.now(datetime.timezone.utc)
-        today_tuple = (today.month, today.day)
+        # Looking up uncached members can take a moment in the slim intent profile
+        await inter.response.defer(ephemeral=True)
+        members = await self.bot.get_or_query_members(inter.guild, [row['user_id'] for row in rows])
+
+        today = datetime.datetime.now(ZoneInfo(self._guild_timezone(inter.guild.id))).date()
+        today_day = _day_of_year(today.month, today.day)
 
         upcoming = []
         passed = []
         for row in rows:
-            member = inter.guild.get_member(row['user_id'])
+            member = members.get(row['user_id'])
             if not member:
                 continue
             entry = (member, row['month'], row['day'])
-            if (row['month'], row['day']) >= today_tuple:
+            if row['day_of_year'] >= today_day:
                 upcoming.append(entry)
             else:
                 passed.append(entry)
@@ -261,7 +422,7 @@ class BirthdayCog(commands.Cog):
         sorted_entries = upcoming + passed
 
         if not sorted_entries:
-            await inter.response.send_message('No birthdays found for current server members.', ephemeral=True)
+            await inter.followup.send('No birthdays found for current server members.', ephemeral=True)
             return
 
         embed = discord.Embed(
@@ -280,7 +441,7 @@ class BirthdayCog(commands.Cog):
         if len(sorted_entries) > 15:
             embed.description += f'\n\n*...and {len(sorted_entries) - 15} more*'
 
-        await inter.response.send_message(embed=embed, ephemeral=True)
+        await inter.followup.send(embed=embed, ephemeral=True)
 
 async def setup(bot: commands.Bot) -> None:
     await bot.add_cog(BirthdayCog(bot))
@@ -0,0 +1,187 @@
+import asyncio
+import sqlite3
+import time
+import aiosqlite
+from typing import Any, Iterable, Optional
+
+DB_PATH = "impbot.db"
+WRITE_BATCH_WINDOW = 0.02  # seconds a burst of writes waits for the rest of it before committing
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = 5000',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -16000',
+)
+
+
+class Database:
+    """Single shared connection for every cog.
+
+    Reads go straight to the connection. Writes are queued and applied by one
+    writer task. A lone write is committed at once; when several are queued
+    together, everything arriving within a short window shares one commit.
+    Because reads share that connection, a read made while a batch is being
+    applied already sees its uncommitted rows.
+    """
+
+    def __init__(self, path: str = DB_PATH, batch_window: float = WRITE_BATCH_WINDOW) -> None:
+        self.path = path
+        self.batch_window = batch_window
+        self.conn: Optional[aiosqlite.Connection] = None
+        self._writes: asyncio.Queue = asyncio.Queue()
+        self._writer_task: Optional[asyncio.Task] = None
+        self.schema_seconds = 0.0
+
+    async def connect(self) -> None:
+        self.conn = await aiosqlite.connect(self.path)
+        self.conn.row_factory = aiosqlite.Row
+        for pragma in PRAGMAS:
+            await self.conn.execute(pragma)
+        self._writer_task = asyncio.create_task(self._writer_loop())
+
+    async def close(self) -> None:
+        if self._writer_task:
+            # The sentinel lets queued writes land before the connection goes away
+            await self._writes.put(None)
+            await self._writer_task
+            self._writer_task = None
+        if self.conn:
+            await self.conn.close()
+            self.conn = None
+
+    def execute(self, sql: str, params: Iterable[Any] = ()) -> Any:
+        """Runs a read query. Use as ``async with db.execute(...) as cursor``."""
+        return self.conn.execute(sql, params)
+
+    async def write(self, sql: str, params: Iterable[Any] = ()) -> int:
+        """Queues one write statement and waits for its commit. Returns the row count."""
+        return await self._enqueue(sql, params, many=False)
+
+    async def write_many(self, sql: str, seq_of_params: Iterable[Iterable[Any]]) -> int:
+        """Queues an executemany statement and waits for its commit. Returns the row count."""
+        return await self._enqueue(sql, list(seq_of_params), many=True)
+
+    async def create_tables(self, *statements: str) -> None:
+        """Queues schema statements together so they land in one commit."""
+        started = time.perf_counter()
+        await asyncio.gather(*(self.write(statement) for statement in statements))
+        # Summed across callers for the startup report; concurrent callers overlap
+        self.schema_seconds += time.perf_counter() - started
+
+    async def _enqueue(self, sql: str, params: Any, many: bool) -> int:
+        if self._writer_task is None or self._writer_task.done():
+            raise RuntimeError('Database writer is not running')
+        future = asyncio.get_running_loop().create_future()
+        await self._writes.put((sql, params, many, future))
+        return await future
+
+    async def _writer_loop(self) -> None:
+        while True:
+            first = await self._writes.get()
+            if first is None:
+                return
+
+            batch = [first]
+            # One yield lets writes issued in the same tick (e.g. a gather) join this batch
+            await asyncio.sleep(0)
+            stopping = self._drain_writes(batch)
+            if len(batch) > 1 and not stopping:
+                # Writes are arriving in a burst, so give the rest of it a moment to land in the same commit.
+                # A lone write is committed straight away instead of paying the window.
+                await asyncio.sleep(self.batch_window)
+                stopping = self._drain_writes(batch)
+
+            try:
+                await self._apply_batch(batch)
+            except Exception as e:
+                # Whatever went wrong belongs to this batch; later writes still get a working writer
+                print(f'[DATABASE] Batch of {len(batch)} writes failed: {e!r}')
+                try:
+                    await self.conn.rollback()
+                except sqlite3.Error:
+                    pass
+                for _, _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            if stopping:
+                return
+
+    def _drain_writes(self, batch: list) -> bool:
+        """Moves every queued write into batch. Returns True if the close sentinel was among them."""
+        stopping = False
+        while not self._writes.empty():
+            queued = self._writes.get_nowait()
+            if queued is None:
+                stopping = True
+                continue
+            batch.append(queued)
+        return stopping
+
+    async def _apply_batch(self, batch: list) -> None:
+        results = []
+        for sql, params, many, future in batch:
+            try:
+                if many:
+                    cursor = await self.conn.executemany(sql, params)
+                else:
+                    cursor = await self.conn.execute(sql, params)
+                results.append((future, cursor.rowcount))
+            except Exception as e:
+                # Bad parameters can raise TypeError or ValueError as well as sqlite3.Error
+                results.append((future, e))
+
+        try:
+            await self.conn.commit()
+        except sqlite3.Error as e:
+            print(f'[DATABASE] Commit failed for a batch of {len(batch)} writes: {e}')
+            await self.conn.rollback()
+            results = [(future, e) for future, _ in results]
+
+        for future, result in results:
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+class GuildSettingsCache:
+    """Write-through cache of a per-guild settings table keyed by guild_id.
+
+    The whole table is loaded once, and every change made through set() or
+    delete() is written to SQLite and the in-memory copy together, so lookups
+    never need to touch the database.
+    """
+
+    def __init__(self, db: Database, table: str, columns: tuple[str, ...]) -> None:
+        self.db = db
+        self.table = table
+        self.columns = columns
+        self._rows: dict[int, dict[str, Any]] = {}
+
+    async def load(self) -> None:
+        async with self.db.execute(
+            f'SELECT guild_id, {", ".join(self.columns)} FROM {self.table}'
+        ) as cursor:
+            rows = await cursor.fetchall()
+        self._rows = {row['guild_id']: {col: row[col] for col in self.columns} for row in rows}
+
+    def get(self, guild_id: int) -> Optional[dict[str, Any]]:
+        return self._rows.get(guild_id)
+
+    def items(self) -> Iterable[tuple[int, dict[str, Any]]]:
+        return self._rows.items()
+
+    async def set(self, guild_id: int, **values: Any) -> None:
+        placeholders = ', '.join('?' for _ in range(len(self.columns) + 1))
+        await self.db.write(
+            f'INSERT OR REPLACE INTO {self.table} (guild_id, {", ".join(self.columns)}) VALUES ({placeholders})',
+            (guild_id, *(values[col] for col in self.columns))
+        )
+        self._rows[guild_id] = {col: values[col] for col in self.columns}
+
+    async def delete(self, guild_id: int) -> None:
+        await self.db.write(f'DELETE FROM {self.table} WHERE guild_id = ?', (guild_id,))
+        self._rows.pop(guild_id, None)
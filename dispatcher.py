@@ -0,0 +1,234 @@
+import asyncio
+import json
+import time
+import aiohttp
+import discord
+from discord.ext import commands
+from typing import Optional, Sequence
+
+from database import Database
+
+DISPATCH_CONCURRENCY = 10
+CHANNEL_SEND_INTERVAL = 1.0  # Discord allows roughly 5 messages per 5 seconds per channel
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 5
+SENT_RETENTION_SECONDS = 7 * 24 * 3600
+ATTACHMENT_EMBED_FIELDS = ('thumbnail', 'image')  # the embed images imagecache.attach_images can point at a file
+
+
+class MessageDispatcher:
+    """Durable outbound message queue shared by every cog.
+
+    Messages are written to SQLite before anything is sent, then drained by
+    one worker per channel at a pace that stays under Discord's per-channel
+    limit. Transient failures are retried with exponential backoff, and
+    pending messages are picked up again after a restart. A dedup_key makes
+    enqueueing idempotent, so a producer that runs twice never posts twice.
+
+    When a message goes out, ``on_outbound_message_sent(dedup_key, message,
+    queued_seconds)`` is dispatched for cogs that need the resulting message.
+    """
+
+    def __init__(self, bot: commands.Bot, db: Database) -> None:
+        self.bot = bot
+        self.db = db
+        self._send_slots = asyncio.Semaphore(DISPATCH_CONCURRENCY)
+        self._workers: dict[int, asyncio.Task] = {}
+        self._wakeups: set[int] = set()
+        self._resume_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        await self.db.create_tables(
+            '''
+                CREATE TABLE IF NOT EXISTS outbound_messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    channel_id INTEGER NOT NULL,
+                    dedup_key TEXT UNIQUE,
+                    payload TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    sent_message_id INTEGER,
+                    sent_at REAL
+                )
+            ''',
+            '''
+                CREATE INDEX IF NOT EXISTS idx_outbound_pending
+                ON outbound_messages (channel_id, id) WHERE sent_at IS NULL
+            ''',
+        )
+        # Sent rows are only kept around so their dedup keys keep rejecting repeats
+        await self.db.write(
+            'DELETE FROM outbound_messages WHERE sent_at < ?',
+            (time.time() - SENT_RETENTION_SECONDS,)
+        )
+        self._resume_task = asyncio.create_task(self._resume_pending())
+
+    async def close(self) -> None:
+        if self._resume_task:
+            self._resume_task.cancel()
+        for worker in self._workers.values():
+            worker.cancel()
+
+    async def enqueue(
+        self,
+        channel: discord.abc.Snowflake,
+        *,
+        content: Optional[str] = None,
+        embed: Optional[discord.Embed] = None,
+        link_buttons: Sequence[tuple[str, str]] = (),
+        attachments: Sequence[tuple[str, str, str]] = (),
+        dedup_key: Optional[str] = None,
+    ) -> bool:
+        """Persists a message for delivery. Returns False if dedup_key was already queued or sent.
+
+        attachments are (filename, local path, original URL) tuples, as returned by
+        imagecache.attach_images. If a file is gone by the time the message is sent,
+        the embed falls back to the original URL.
+        """
+        payload = {
+            'content': content,
+            'embed': embed.to_dict() if embed else None,
+            'link_buttons': [list(button) for button in link_buttons],
+            'attachments': [list(attachment) for attachment in attachments],
+        }
+        now = time.time()
+        inserted = await self.db.write(
+            'INSERT OR IGNORE INTO outbound_messages (channel_id, dedup_key, payload, next_attempt_at, created_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (channel.id, dedup_key, json.dumps(payload), now, now)
+        )
+        if inserted:
+            self._wake(channel.id)
+        return inserted > 0
+
+    async def forget(self, dedup_key: str) -> None:
+        """Drops a message, pending or sent, so the same dedup_key can be queued again."""
+        await self.db.write('DELETE FROM outbound_messages WHERE dedup_key = ?', (dedup_key,))
+
+    def _wake(self, channel_id: int) -> None:
+        self._wakeups.add(channel_id)
+        if channel_id not in self._workers:
+            self._workers[channel_id] = asyncio.create_task(self._drain(channel_id))
+
+    async def _resume_pending(self) -> None:
+        await self.bot.wait_until_ready()
+        async with self.db.execute(
+            'SELECT DISTINCT channel_id FROM outbound_messages WHERE sent_at IS NULL'
+        ) as cursor:
+            rows = await cursor.fetchall()
+        for row in rows:
+            self._wake(row['channel_id'])
+
+    @staticmethod
+    def _build_view(link_buttons: list) -> Optional[discord.ui.View]:
+        if not link_buttons:
+            return None
+        view = discord.ui.View(timeout=None)
+        for label, url in link_buttons:
+            view.add_item(discord.ui.Button(label=label, style=discord.ButtonStyle.link, url=url))
+        return view
+
+    @staticmethod
+    def _build_files(payload: dict) -> list[discord.File]:
+        files = []
+        for filename, path, url in payload.get('attachments', []):
+            try:
+                files.append(discord.File(path, filename=filename))
+            except OSError:
+                # Evicted from the image cache while queued, so point the embed back at the original
+                for field in ATTACHMENT_EMBED_FIELDS:
+                    image = (payload['embed'] or {}).get(field)
+                    if image and image.get('url') == f'attachment://{filename}':
+                        payload['embed'][field] = {'url': url}
+        return files
+
+    async def _drain(self, channel_id: int) -> None:
+        await self.bot.wait_until_ready()
+        try:
+            while True:
+                self._wakeups.discard(channel_id)
+                async with self.db.execute(
+                    'SELECT id, dedup_key, payload, attempts, next_attempt_at, created_at FROM outbound_messages '
+                    'WHERE channel_id = ? AND sent_at IS NULL ORDER BY id LIMIT 1',
+                    (channel_id,)
+                ) as cursor:
+                    row = await cursor.fetchone()
+
+                if not row:
+                    # A message enqueued while we were reading sets the wakeup flag again
+                    if channel_id in self._wakeups:
+                        continue
+                    return
+
+                delay = row['next_attempt_at'] - time.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+
+                try:
+                    await self._deliver(channel_id, row)
+                except Exception as e:
+                    # Anything unexpected is retried like a transient failure, so the row can't wedge the queue
+                    await self._schedule_retry(row, e)
+                await asyncio.sleep(CHANNEL_SEND_INTERVAL)
+        finally:
+            self._workers.pop(channel_id, None)
+
+    async def _deliver(self, channel_id: int, row) -> None:
+        try:
+            payload = json.loads(row['payload'])
+            files = self._build_files(payload)
+            embed = discord.Embed.from_dict(payload['embed']) if payload['embed'] else None
+            view = self._build_view(payload['link_buttons'])
+        except (KeyError, TypeError, ValueError) as e:
+            print(f'[DISPATCH] Message {row["id"]} has an unreadable payload, dropping it: {e}')
+            await self.db.write('DELETE FROM outbound_messages WHERE id = ?', (row['id'],))
+            return
+
+        try:
+            # A guild that is unavailable or not cached yet has no channel objects, so ask the API
+            channel = self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
+            async with self._send_slots:
+                # Discord answers a repeated nonce with the original message, so a send that landed just
+                # before a crash isn't posted twice when the row is retried after a restart
+                message = await channel.send(
+                    content=payload['content'],
+                    embed=embed,
+                    view=view,
+                    files=files,
+                    nonce=f'dispatch-{row["id"]}',
+                )
+        except (discord.Forbidden, discord.NotFound) as e:
+            print(f'[DISPATCH] Cannot send to channel {channel_id}, dropping message {row["id"]}: {e}')
+            await self.db.write('DELETE FROM outbound_messages WHERE id = ?', (row['id'],))
+            return
+        except discord.HTTPException as e:
+            if e.status < 500 and e.status != 429:
+                print(f'[DISPATCH] Message {row["id"]} rejected by Discord, dropping it: {e}')
+                await self.db.write('DELETE FROM outbound_messages WHERE id = ?', (row['id'],))
+                return
+            await self._schedule_retry(row, e)
+            return
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            await self._schedule_retry(row, e)
+            return
+
+        await self.db.write(
+            'UPDATE outbound_messages SET sent_message_id = ?, sent_at = ? WHERE id = ?',
+            (message.id, time.time(), row['id'])
+        )
+        self.bot.dispatch('outbound_message_sent', row['dedup_key'], message, time.time() - row['created_at'])
+
+    async def _schedule_retry(self, row, error: Exception) -> None:
+        attempts = row['attempts'] + 1
+        if attempts >= MAX_ATTEMPTS:
+            print(f'[DISPATCH] Giving up on message {row["id"]} after {attempts} attempts: {error}')
+            await self.db.write('DELETE FROM outbound_messages WHERE id = ?', (row['id'],))
+            return
+        delay = RETRY_BASE_SECONDS * 2 ** row['attempts']
+        print(f'[DISPATCH] Send failed for message {row["id"]}, retrying in {delay}s: {error}')
+        await self.db.write(
+            'UPDATE outbound_messages SET attempts = ?, next_attempt_at = ? WHERE id = ?',
+            (attempts, time.time() + delay, row['id'])
+        )
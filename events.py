@@ -1,31 +1,48 @@
 import asyncio
 import os
+import time
 import aiohttp
-import aiosqlite
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 from dotenv import load_dotenv
 from typing import Optional
 
+from database import Database, GuildSettingsCache
+from imagecache import attach_images
+
 load_dotenv()
 TWITCH_ACCESS_TOKEN = os.getenv("TWITCH_ACCESS_TOKEN")
 TWITCH_CLIENT_ID = os.getenv("TWITCH_CLIENT_ID")
 
-DB_PATH = "impbot.db"
 EVENTSUB_WS_URL = "wss://eventsub.wss.twitch.tv/ws"
+EVENTSUB_SUBSCRIPTIONS_URL = "https://api.twitch.tv/helix/eventsub/subscriptions"
+SUBSCRIBE_CONCURRENCY = 10
+SUBSCRIBE_MAX_ATTEMPTS = 3
+PROFILE_TTL_SECONDS = 6 * 3600
+HELIX_BATCH_SIZE = 100
+LATENCY_TRACKING_SECONDS = 3600
 
 
 class EventsCog(commands.Cog):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
-        self.db: aiosqlite.Connection = None  # type: ignore[assignment]
+        self.db: Database = None  # type: ignore[assignment]
+        self.channels: GuildSettingsCache = None  # type: ignore[assignment]
         self.twitch_headers = {
             'Authorization': f'Bearer {TWITCH_ACCESS_TOKEN}',
             'Client-Id': TWITCH_CLIENT_ID or '',
         }
         self._eventsub_task: Optional[asyncio.Task] = None
         self._session_id: Optional[str] = None
+        # Helix rate-limit bucket as last reported by the Ratelimit-* response headers
+        self._helix_remaining: Optional[int] = None
+        self._helix_reset_at = 0.0
+        # Twitch user profiles (avatar, display name) keyed by user ID, with the time they were fetched
+        self._profiles: dict[str, tuple[dict, float]] = {}
+        # Seconds from notification receipt to delivery, per guild, for the most recent go-live
+        self.last_delivery_latencies: dict[int, float] = {}
+        self._live_received: dict[str, float] = {}
 
     stream_group = app_commands.Group(name='stream', description='Stream notification commands')
 
@@ -34,49 +51,48 @@ class EventsCog(commands.Cog):
     # -------------------------------------------------------------------------
 
     async def cog_load(self) -> None:
-        self.db = await aiosqlite.connect(DB_PATH)
-        self.db.row_factory = aiosqlite.Row
+        self.db = self.bot.db
         await self._create_tables()
+        self.channels = GuildSettingsCache(self.db, 'stream_channels', ('channel_id',))
+        await self.channels.load()
         self._eventsub_task = asyncio.create_task(self._eventsub_loop())
+        self.refresh_profiles_task.start()
 
     async def cog_unload(self) -> None:
+        self.refresh_profiles_task.cancel()
         if self._eventsub_task:
             self._eventsub_task.cancel()
-        if self.db:
-            await self.db.close()
 
     async def _create_tables(self) -> None:
-        await self.db.execute('''
-            CREATE TABLE IF NOT EXISTS stream_channels (
-                guild_id INTEGER PRIMARY KEY,
-                channel_id INTEGER NOT NULL
-            )
-        ''')
-        await self.db.execute('''
-            CREATE TABLE IF NOT EXISTS watched_streams (
-                twitch_user_id TEXT NOT NULL,
-                twitch_login TEXT NOT NULL,
-                guild_id INTEGER NOT NULL,
-                PRIMARY KEY (twitch_user_id, guild_id)
-            )
-        ''')
-        await self.db.commit()
+        await self.db.create_tables(
+            '''
+                CREATE TABLE IF NOT EXISTS stream_channels (
+                    guild_id INTEGER PRIMARY KEY,
+                    channel_id INTEGER NOT NULL
+                )
+            ''',
+            '''
+                CREATE TABLE IF NOT EXISTS watched_streams (
+                    twitch_user_id TEXT NOT NULL,
+                    twitch_login TEXT NOT NULL,
+                    guild_id INTEGER NOT NULL,
+                    PRIMARY KEY (twitch_user_id, guild_id)
+                )
+            ''',
+        )
 
     # -------------------------------------------------------------------------
     # DB helpers
     # -------------------------------------------------------------------------
 
-    async def _get_stream_channel(self, guild_id: int) -> Optional[discord.TextChannel]:
-        async with self.db.execute(
-            'SELECT channel_id FROM stream_channels WHERE guild_id = ?', (guild_id,)
-        ) as cursor:
-            row = await cursor.fetchone()
-        if not row:
+    def _get_stream_channel(self, guild_id: int) -> Optional[discord.TextChannel]:
+        settings = self.channels.get(guild_id)
+        if not settings:
             return None
         guild = self.bot.get_guild(guild_id)
         if not guild:
             return None
-        channel = guild.get_channel(row['channel_id'])
+        channel = guild.get_channel(settings['channel_id'])
         return channel if isinstance(channel, discord.TextChannel) else None
 
     async def _get_all_watched_user_ids(self) -> list[str]:
@@ -91,6 +107,44 @@ class EventsCog(commands.Cog):
             rows = await cursor.fetchall()
         return [row['guild_id'] for row in rows]
 
+    # -------------------------------------------------------------------------
+    # Twitch profile cache
+    # -------------------------------------------------------------------------
+
+    def _cache_profile(self, user: dict) -> None:
+        self._profiles[user['id']] = (user, time.time())
+
+    def _get_cached_profile(self, user_id: str) -> Optional[dict]:
+        cached = self._profiles.get(user_id)
+        return cached[0] if cached else None
+
+    async def _fetch_profiles(self, user_ids: list[str]) -> None:
+        for start in range(0, len(user_ids), HELIX_BATCH_SIZE):
+            batch = user_ids[start:start + HELIX_BATCH_SIZE]
+            async with self.bot.http_session.get(
+                'https://api.twitch.tv/helix/users',
+                headers=self.twitch_headers,
+                params=[('id', user_id) for user_id in batch]
+            ) as resp:
+                if resp.status != 200:
+                    print(f'[EVENTSUB] Failed to refresh {len(batch)} Twitch profiles: {resp.status}')
+                    continue
+                data = await resp.json()
+            for user in data.get('data', []):
+                self._cache_profile(user)
+
+    @tasks.loop(minutes=30)
+    async def refresh_profiles_task(self) -> None:
+        await self.bot.wait_until_ready()
+        watched = await self._get_all_watched_user_ids()
+        cutoff = time.time() - PROFILE_TTL_SECONDS
+        stale = [
+            user_id for user_id in watched
+            if user_id not in self._profiles or self._profiles[user_id][1] < cutoff
+        ]
+        if stale:
+            await self._fetch_profiles(stale)
+
     # -------------------------------------------------------------------------
     # EventSub WebSocket
     # -------------------------------------------------------------------------
@@ -124,27 +178,26 @@ class EventsCog(commands.Cog):
 
     async def _eventsub_session(self, ws_url: str, resubscribe: bool) -> Optional[str]:
         """Runs one EventSub session. Returns reconnect URL if Twitch requested one, else None."""
-        async with aiohttp.ClientSession(headers=self.twitch_headers) as http_session:
-            async with http_session.ws_connect(ws_url) as ws:
-                self._session_id = await self._handshake(ws)
-                print(f'[EVENTSUB] Connected (session {self._session_id})')
-
-                if resubscribe:
-                    await self._subscribe_all(http_session, self._session_id)
-
-                async for msg in ws:
-                    if msg.type == aiohttp.WSMsgType.TEXT:
-                        data = msg.json()
-                        msg_type = data.get('metadata', {}).get('message_type')
-                        match msg_type:
-                            case 'notification':
-                                await self._handle_notification(data.get('payload', {}))
-                            case 'session_reconnect':
-                                return data['payload']['session']['reconnect_url']
-                            case 'session_keepalive' | 'session_welcome':
-                                pass
-                    elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
-                        raise aiohttp.ClientError(f'WebSocket closed: {ws.close_code}')
+        async with self.bot.http_session.ws_connect(ws_url) as ws:
+            self._session_id = await self._handshake(ws)
+            print(f'[EVENTSUB] Connected (session {self._session_id})')
+
+            if resubscribe:
+                await self._subscribe_all(self.bot.http_session, self._session_id)
+
+            async for msg in ws:
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    data = msg.json()
+                    msg_type = data.get('metadata', {}).get('message_type')
+                    match msg_type:
+                        case 'notification':
+                            await self._handle_notification(data.get('payload', {}))
+                        case 'session_reconnect':
+                            return data['payload']['session']['reconnect_url']
+                        case 'session_keepalive' | 'session_welcome':
+                            pass
+                elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                    raise aiohttp.ClientError(f'WebSocket closed: {ws.close_code}')
 
         self._session_id = None
         return None
@@ -160,9 +213,34 @@ class EventsCog(commands.Cog):
 
         return await asyncio.wait_for(_await_welcome(), timeout=15)
 
+    def _note_rate_limit(self, resp: aiohttp.ClientResponse) -> None:
+        remaining = resp.headers.get('Ratelimit-Remaining')
+        reset = resp.headers.get('Ratelimit-Reset')
+        if remaining is not None and reset is not None:
+            self._helix_remaining = int(remaining)
+            self._helix_reset_at = float(reset)
+
+    async def _wait_for_rate_limit(self) -> None:
+        if self._helix_remaining == 0:
+            delay = self._helix_reset_at - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._helix_remaining = None
+
     async def _subscribe_all(self, session: aiohttp.ClientSession, session_id: str) -> None:
-        for user_id in await self._get_all_watched_user_ids():
-            await self._subscribe(session, session_id, user_id)
+        started = time.perf_counter()
+        # Only called for a brand-new session, which no existing subscription can be bound to, so there is
+        # nothing to list or diff against. Skipping that keeps the 10s subscribe-after-welcome window free.
+        watched = set(await self._get_all_watched_user_ids())
+
+        semaphore = asyncio.Semaphore(SUBSCRIBE_CONCURRENCY)
+
+        async def subscribe(user_id: str) -> None:
+            async with semaphore:
+                await self._subscribe(session, session_id, user_id)
+
+        await asyncio.gather(*(subscribe(user_id) for user_id in watched))
+        print(f'[EVENTSUB] Bootstrap finished in {time.perf_counter() - started:.2f}s: {len(watched)} subscriptions')
 
     async def _subscribe(self, session: aiohttp.ClientSession, session_id: str, user_id: str) -> None:
         payload = {
@@ -171,35 +249,56 @@ class EventsCog(commands.Cog):
             'condition': {'broadcaster_user_id': user_id},
             'transport': {'method': 'websocket', 'session_id': session_id},
         }
-        async with session.post(
-            'https://api.twitch.tv/helix/eventsub/subscriptions', json=payload
-        ) as resp:
-            if resp.status not in (200, 202):
+        for _ in range(SUBSCRIBE_MAX_ATTEMPTS):
+            await self._wait_for_rate_limit()
+            async with session.post(EVENTSUB_SUBSCRIPTIONS_URL, headers=self.twitch_headers, json=payload) as resp:
+                self._note_rate_limit(resp)
+                if resp.status in (200, 202, 409):
+                    # 409 means the subscription already exists
+                    return
+                if resp.status == 429:
+                    self._helix_remaining = 0
+                    self._helix_reset_at = max(self._helix_reset_at, time.time() + 1)
+                    continue
                 body = await resp.json()
                 print(f'[EVENTSUB] Failed to subscribe to {user_id}: {resp.status} {body}')
+                return
+        print(f'[EVENTSUB] Gave up subscribing to {user_id} after {SUBSCRIBE_MAX_ATTEMPTS} rate-limited attempts')
 
     async def _cancel_subscription(self, twitch_user_id: str) -> None:
-        async with aiohttp.ClientSession(headers=self.twitch_headers) as session:
-            async with session.get(
-                f'https://api.twitch.tv/helix/eventsub/subscriptions?user_id={twitch_user_id}'
+        session = self.bot.http_session
+        async with session.get(
+            f'https://api.twitch.tv/helix/eventsub/subscriptions?user_id={twitch_user_id}',
+            headers=self.twitch_headers
+        ) as resp:
+            if resp.status != 200:
+                print(f'[EVENTSUB] Failed to list subscriptions for {twitch_user_id}: {resp.status}')
+                return
+            data = await resp.json()
+
+        for sub in data.get('data', []):
+            if sub.get('type') != 'stream.online':
+                continue
+            async with session.delete(
+                f'https://api.twitch.tv/helix/eventsub/subscriptions?id={sub["id"]}',
+                headers=self.twitch_headers
             ) as resp:
-                if resp.status != 200:
-                    print(f'[EVENTSUB] Failed to list subscriptions for {twitch_user_id}: {resp.status}')
-                    return
-                data = await resp.json()
+                if resp.status == 204:
+                    print(f'[EVENTSUB] Cancelled subscription {sub["id"]} for {twitch_user_id}')
+                else:
+                    print(f'[EVENTSUB] Failed to cancel subscription {sub["id"]}: {resp.status}')
 
-            for sub in data.get('data', []):
-                if sub.get('type') != 'stream.online':
-                    continue
-                async with session.delete(
-                    f'https://api.twitch.tv/helix/eventsub/subscriptions?id={sub["id"]}'
-                ) as resp:
-                    if resp.status == 204:
-                        print(f'[EVENTSUB] Cancelled subscription {sub["id"]} for {twitch_user_id}')
-                    else:
-                        print(f'[EVENTSUB] Failed to cancel subscription {sub["id"]}: {resp.status}')
+    async def _fetch_stream(self, user_id: str) -> Optional[dict]:
+        async with self.bot.http_session.get(
+            'https://api.twitch.tv/helix/streams', headers=self.twitch_headers, params={'user_id': user_id}
+        ) as resp:
+            if resp.status != 200:
+                return None
+            stream_data = await resp.json()
+        return stream_data['data'][0] if stream_data.get('data') else None
 
     async def _handle_notification(self, payload: dict) -> None:
+        received = time.time()
         event = payload.get('event', {})
         user_id = event.get('broadcaster_user_id')
         login = event.get('broadcaster_user_login')
@@ -210,29 +309,18 @@ class EventsCog(commands.Cog):
         if not guild_ids:
             return
 
-        async with aiohttp.ClientSession(headers=self.twitch_headers) as session:
-            async with session.get(
-                f'https://api.twitch.tv/helix/streams?user_login={login}'
-            ) as resp:
-                if resp.status != 200:
-                    return
-                stream_data = await resp.json()
-                if not stream_data.get('data'):
-                    return
-                stream = stream_data['data'][0]
-
-            async with session.get(f'https://api.twitch.tv/helix/users?login={login}') as resp:
-                user_data = await resp.json()
-                avatar_url = user_data['data'][0]['profile_image_url'] if user_data.get('data') else None
-
-        class TwitchLinkButton(discord.ui.View):
-            def __init__(self):
-                super().__init__()
-                self.add_item(discord.ui.Button(
-                    label='Watch now!',
-                    style=discord.ButtonStyle.blurple,
-                    url=f'https://www.twitch.tv/{login}'
-                ))
+        # stream.online carries no title or game, so that still takes one Helix call.
+        # The profile normally comes from the cache; on a miss it is fetched alongside.
+        if self._get_cached_profile(user_id):
+            stream = await self._fetch_stream(user_id)
+        else:
+            stream, _ = await asyncio.gather(self._fetch_stream(user_id), self._fetch_profiles([user_id]))
+        if not stream:
+            return
+
+        profile = self._get_cached_profile(user_id)
+        avatar_url = profile['profile_image_url'] if profile else None
+        display_name = event.get('broadcaster_user_name') or (profile['display_name'] if profile else login)
 
         embed = discord.Embed(
             title=stream.get('title', 'Untitled stream'),
@@ -240,20 +328,50 @@ class EventsCog(commands.Cog):
             description=f'Now streaming {stream.get("game_name", "something")}',
             color=discord.Color.purple()
         )
-        embed.set_author(name=f'{login} is now live on Twitch!', url=f'https://www.twitch.tv/{login}')
-        embed.set_image(url=f'https://static-cdn.jtvnw.net/previews-ttv/live_user_{login}-440x248.jpg')
-        if avatar_url:
-            embed.set_thumbnail(url=avatar_url)
+        embed.set_author(name=f'{display_name} is now live on Twitch!', url=f'https://www.twitch.tv/{login}')
         embed.set_footer(text='Imp Bot 10000')
+        # The preview URL never changes for a channel, so key it by stream to dodge stale thumbnails,
+        # both in our cache and in Discord's image proxy when the cache is off
+        preview_url = f'https://static-cdn.jtvnw.net/previews-ttv/live_user_{login}-440x248.jpg?stream={stream["id"]}'
+        attachments = await attach_images(
+            self.bot.image_cache, embed,
+            thumbnail=avatar_url,
+            image=preview_url,
+            image_key=f'twitch-preview:{stream["id"]}',
+        )
+
+        self._live_received = {
+            stream_id: at for stream_id, at in self._live_received.items()
+            if at > received - LATENCY_TRACKING_SECONDS
+        }
+        self._live_received[stream['id']] = received
 
+        # Enqueued together so every guild lands in one database commit, and the dispatcher then drains
+        # each guild's channel independently. Keying on the stream ID drops EventSub redeliveries.
+        enqueues = []
         for guild_id in guild_ids:
-            channel = await self._get_stream_channel(guild_id)
+            channel = self._get_stream_channel(guild_id)
             if channel:
-                try:
-                    await channel.send(embed=embed, view=TwitchLinkButton())
-                    print(f'[EVENTSUB] Sent notification for {login} in guild {guild_id}')
-                except discord.HTTPException as e:
-                    print(f'[EVENTSUB] Failed to send notification in guild {guild_id}: {e}')
+                enqueues.append(self.bot.dispatcher.enqueue(
+                    channel,
+                    embed=embed,
+                    link_buttons=[('Watch now!', f'https://www.twitch.tv/{login}')],
+                    attachments=attachments,
+                    dedup_key=f'golive:{stream["id"]}:{guild_id}',
+                ))
+        await asyncio.gather(*enqueues)
+
+    @commands.Cog.listener()
+    async def on_outbound_message_sent(
+        self, dedup_key: Optional[str], message: discord.Message, queued_seconds: float
+    ) -> None:
+        if not dedup_key or not dedup_key.startswith('golive:'):
+            return
+        _, stream_id, guild_id = dedup_key.split(':')
+        received = self._live_received.get(stream_id)
+        latency = time.time() - received if received else queued_seconds
+        self.last_delivery_latencies[int(guild_id)] = latency
+        print(f'[EVENTSUB] Sent notification in guild {guild_id} ({latency:.2f}s after go-live event)')
 
     # -------------------------------------------------------------------------
     # Admin commands
@@ -266,11 +384,7 @@ class EventsCog(commands.Cog):
         if not inter.guild:
             await inter.response.send_message('This command can only be used in a server.', ephemeral=True)
             return
-        await self.db.execute(
-            'INSERT OR REPLACE INTO stream_channels (guild_id, channel_id) VALUES (?, ?)',
-            (inter.guild.id, channel.id)
-        )
-        await self.db.commit()
+        await self.channels.set(inter.guild.id, channel_id=channel.id)
         await inter.response.send_message(
             f'Stream notifications will be sent to {channel.mention}.', ephemeral=True
         )
@@ -285,26 +399,28 @@ class EventsCog(commands.Cog):
 
         await inter.response.defer(ephemeral=True)
 
-        async with aiohttp.ClientSession(headers=self.twitch_headers) as session:
-            async with session.get(f'https://api.twitch.tv/helix/users?login={twitch_login}') as resp:
-                if resp.status != 200:
-                    await inter.followup.send(f'Failed to look up `{twitch_login}`.', ephemeral=True)
-                    return
-                data = await resp.json()
-                if not data.get('data'):
-                    await inter.followup.send(f'Twitch user `{twitch_login}` not found.', ephemeral=True)
-                    return
-                user = data['data'][0]
+        session = self.bot.http_session
+        async with session.get(
+            f'https://api.twitch.tv/helix/users?login={twitch_login}', headers=self.twitch_headers
+        ) as resp:
+            if resp.status != 200:
+                await inter.followup.send(f'Failed to look up `{twitch_login}`.', ephemeral=True)
+                return
+            data = await resp.json()
+            if not data.get('data'):
+                await inter.followup.send(f'Twitch user `{twitch_login}` not found.', ephemeral=True)
+                return
+            user = data['data'][0]
+        self._cache_profile(user)
 
-            await self.db.execute(
-                'INSERT OR IGNORE INTO watched_streams (twitch_user_id, twitch_login, guild_id) VALUES (?, ?, ?)',
-                (user['id'], user['login'], inter.guild.id)
-            )
-            await self.db.commit()
+        await self.db.write(
+            'INSERT OR IGNORE INTO watched_streams (twitch_user_id, twitch_login, guild_id) VALUES (?, ?, ?)',
+            (user['id'], user['login'], inter.guild.id)
+        )
 
-            # Subscribe immediately if there's an active EventSub session
-            if self._session_id:
-                await self._subscribe(session, self._session_id, user['id'])
+        # Subscribe immediately if there's an active EventSub session
+        if self._session_id:
+            await self._subscribe(session, self._session_id, user['id'])
 
         await inter.followup.send(f'Now watching **{user["login"]}** for streams.', ephemeral=True)
 
@@ -329,15 +445,15 @@ class EventsCog(commands.Cog):
             return
 
         twitch_user_id = row['twitch_user_id']
-        await self.db.execute(
+        await self.db.write(
             'DELETE FROM watched_streams WHERE twitch_login = ? AND guild_id = ?',
             (twitch_login.lower(), inter.guild.id)
         )
-        await self.db.commit()
 
         # Cancel the EventSub subscription only if no other guild is still watching this user
         if not await self._get_guilds_for_user(twitch_user_id):
             await self._cancel_subscription(twitch_user_id)
+            self._profiles.pop(twitch_user_id, None)
 
         await inter.followup.send(f'Stopped watching **{twitch_login}**.', ephemeral=True)
 
@@ -368,13 +484,17 @@ class EventsCog(commands.Cog):
     async def on_member_join(self, member: discord.Member):
         channel = member.guild.system_channel
         if channel is not None:
-            await channel.send(f'Welcome to {member.display_name} to {member.guild.name}!')
+            await self.bot.dispatcher.enqueue(
+                channel, content=f'Welcome to {member.display_name} to {member.guild.name}!'
+            )
 
     @commands.Cog.listener()
     async def on_member_remove(self, member: discord.Member):
         channel = member.guild.system_channel
         if channel is not None:
-            await channel.send(f'{member.display_name} has abandoned the cause and left {member.guild.name}!')
+            await self.bot.dispatcher.enqueue(
+                channel, content=f'{member.display_name} has abandoned the cause and left {member.guild.name}!'
+            )
 
 
 async def setup(bot: commands.Bot) -> None:
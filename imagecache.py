@@ -0,0 +1,252 @@
+import asyncio
+import hashlib
+import io
+import os
+import sqlite3
+import time
+import aiohttp
+import discord
+from typing import Optional
+
+from database import Database
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it images are cached at their original size
+    Image = None
+
+IMAGE_CACHE_MAX_BYTES = int(float(os.getenv("IMAGE_CACHE_MAX_MB", "200")) * 1024 * 1024)
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "512"))
+IMAGE_FETCH_TIMEOUT = 10
+MAX_SOURCE_BYTES = 8 * 1024 * 1024
+IMAGE_CHUNK_SIZE = 64 * 1024
+CONTENT_TYPE_EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+}
+
+
+class ImageCache:
+    """Content-addressed, size-bounded disk cache for images posted in embeds.
+
+    Images are downloaded once, downscaled when Pillow is installed, and
+    stored under the SHA-256 of their bytes, so different URLs for the same
+    picture share one file. Callers look images up by a cache key, which
+    defaults to the URL; live previews pass a key that changes with the
+    stream so they never reuse an old frame. Once the directory grows past
+    its budget, the least recently used files are deleted.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        db: Database,
+        directory: str,
+        max_bytes: int = IMAGE_CACHE_MAX_BYTES,
+        max_dimension: int = IMAGE_MAX_DIMENSION,
+    ) -> None:
+        self.session = session
+        self.db = db
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_dimension = max_dimension
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        # One download per key at a time, however many posts want it
+        self._pending: dict[str, asyncio.Task] = {}
+
+    async def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        await self.db.create_tables(
+            '''
+                CREATE TABLE IF NOT EXISTS image_cache_files (
+                    digest TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    source_size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            ''',
+            '''
+                CREATE TABLE IF NOT EXISTS image_cache_keys (
+                    cache_key TEXT PRIMARY KEY,
+                    digest TEXT NOT NULL
+                )
+            ''',
+            '''
+                CREATE INDEX IF NOT EXISTS idx_image_cache_files_last_used
+                ON image_cache_files (last_used)
+            ''',
+        )
+        async with self.db.execute('SELECT COALESCE(SUM(size), 0) AS total FROM image_cache_files') as cursor:
+            row = await cursor.fetchone()
+        self.total_bytes = row['total']
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    async def localize(self, url: str, cache_key: Optional[str] = None) -> Optional[tuple[str, str]]:
+        """Returns (attachment filename, local path) for url, or None if it should stay hot-linked."""
+        cache_key = cache_key or url
+        try:
+            return await self._localize(url, cache_key)
+        except (OSError, sqlite3.Error) as e:
+            # A full or unwritable disk shouldn't cost the post; it just goes out with the remote URL
+            print(f'[IMAGECACHE] Could not cache {url}: {e}')
+            return None
+
+    async def _localize(self, url: str, cache_key: str) -> Optional[tuple[str, str]]:
+        async with self.db.execute(
+            'SELECT f.digest, f.filename, f.source_size FROM image_cache_keys k '
+            'JOIN image_cache_files f ON f.digest = k.digest WHERE k.cache_key = ?',
+            (cache_key,)
+        ) as cursor:
+            row = await cursor.fetchone()
+
+        if row and os.path.exists(os.path.join(self.directory, row['filename'])):
+            self.hits += 1
+            self.bytes_saved += row['source_size']
+            await self.db.write(
+                'UPDATE image_cache_files SET last_used = ? WHERE digest = ?', (time.time(), row['digest'])
+            )
+            return row['filename'], os.path.join(self.directory, row['filename'])
+
+        task = self._pending.get(cache_key)
+        if task is None:
+            task = self._pending[cache_key] = asyncio.create_task(self._store(url, cache_key))
+            task.add_done_callback(lambda _: self._pending.pop(cache_key, None))
+        return await asyncio.shield(task)
+
+    async def _store(self, url: str, cache_key: str) -> Optional[tuple[str, str]]:
+        self.misses += 1
+        try:
+            async with self.session.get(url, timeout=aiohttp.ClientTimeout(total=IMAGE_FETCH_TIMEOUT)) as resp:
+                extension = CONTENT_TYPE_EXTENSIONS.get(resp.content_type)
+                if resp.status != 200 or not extension:
+                    return None
+                if resp.content_length and resp.content_length > MAX_SOURCE_BYTES:
+                    return None
+                # Chunked responses have no length up front, so the cap is enforced while reading
+                chunks = []
+                received = 0
+                async for chunk in resp.content.iter_chunked(IMAGE_CHUNK_SIZE):
+                    received += len(chunk)
+                    if received > MAX_SOURCE_BYTES:
+                        print(f'[IMAGECACHE] {url} is over the {MAX_SOURCE_BYTES} byte download limit, not caching it')
+                        return None
+                    chunks.append(chunk)
+                data = b''.join(chunks)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f'[IMAGECACHE] Could not fetch {url}: {e}')
+            return None
+
+        source_size = len(data)
+        if Image is not None:
+            # Decoding and re-encoding is CPU-bound, so keep it off the event loop
+            data, extension = await asyncio.to_thread(self._downscale, data, extension)
+        self.bytes_saved += source_size - len(data)
+
+        digest = hashlib.sha256(data).hexdigest()
+        filename = f'{digest[:32]}.{extension}'
+        path = os.path.join(self.directory, filename)
+        if not os.path.exists(path):
+            await asyncio.to_thread(self._write_file, path, data)
+            self.total_bytes += len(data)
+
+        await self.db.write(
+            'INSERT INTO image_cache_files (digest, filename, size, source_size, last_used) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (digest) DO UPDATE SET last_used = excluded.last_used',
+            (digest, filename, len(data), source_size, time.time())
+        )
+        await self.db.write(
+            'INSERT OR REPLACE INTO image_cache_keys (cache_key, digest) VALUES (?, ?)', (cache_key, digest)
+        )
+
+        if self.total_bytes > self.max_bytes:
+            await self._evict()
+        return filename, path
+
+    def _downscale(self, data: bytes, extension: str) -> tuple[bytes, str]:
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                if getattr(image, 'is_animated', False) or max(image.size) <= self.max_dimension:
+                    return data, extension
+                image.thumbnail((self.max_dimension, self.max_dimension))
+                output = io.BytesIO()
+                if image.mode in ('RGBA', 'LA', 'P'):
+                    image.save(output, format='PNG', optimize=True)
+                    resized, resized_extension = output.getvalue(), 'png'
+                else:
+                    image.convert('RGB').save(output, format='JPEG', quality=85, optimize=True)
+                    resized, resized_extension = output.getvalue(), 'jpg'
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            print(f'[IMAGECACHE] Could not downscale image: {e}')
+            return data, extension
+        return (resized, resized_extension) if len(resized) < len(data) else (data, extension)
+
+    @staticmethod
+    def _write_file(path: str, data: bytes) -> None:
+        # Write then rename, so a reader never sees half a file
+        temporary = f'{path}.tmp'
+        try:
+            with open(temporary, 'wb') as file:
+                file.write(data)
+            os.replace(temporary, path)
+        except OSError:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+    async def _evict(self) -> None:
+        async with self.db.execute(
+            'SELECT digest, filename, size FROM image_cache_files ORDER BY last_used'
+        ) as cursor:
+            rows = await cursor.fetchall()
+
+        evicted = []
+        for row in rows:
+            if self.total_bytes <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(os.path.join(self.directory, row['filename']))
+            except FileNotFoundError:
+                pass
+            self.total_bytes -= row['size']
+            evicted.append((row['digest'],))
+
+        await self.db.write_many('DELETE FROM image_cache_keys WHERE digest = ?', evicted)
+        await self.db.write_many('DELETE FROM image_cache_files WHERE digest = ?', evicted)
+        print(f'[IMAGECACHE] Evicted {len(evicted)} images, {self.total_bytes / 1024 / 1024:.1f} MB cached')
+
+
+async def attach_images(
+    image_cache: Optional[ImageCache],
+    embed: discord.Embed,
+    *,
+    thumbnail: Optional[str] = None,
+    image: Optional[str] = None,
+    image_key: Optional[str] = None,
+) -> list[tuple[str, str, str]]:
+    """Sets the embed's thumbnail and image, through the cache when there is one.
+
+    Returns the attachments to hand to MessageDispatcher.enqueue as
+    (filename, path, original URL) tuples.
+    """
+    attachments = []
+    for url, cache_key, setter in ((thumbnail, None, embed.set_thumbnail), (image, image_key, embed.set_image)):
+        if not url:
+            continue
+        local = await image_cache.localize(url, cache_key) if image_cache else None
+        if local:
+            filename, path = local
+            setter(url=f'attachment://{filename}')
+            attachments.append((filename, path, url))
+        else:
+            setter(url=url)
+    return attachments
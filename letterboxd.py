@@ -1,4 +1,16 @@
+import asyncio
+import calendar
+import collections
+import csv
+import datetime
+import email.utils
+import hashlib
+import io
+import os
 import re
+import statistics
+import time
+import zlib
 import aiohttp
 import aiosqlite
 import discord
@@ -7,7 +19,9 @@ from discord import app_commands
 from discord.ext import commands, tasks
 from typing import Optional, List
 
-DB_PATH = "impbot.db"
+from database import Database, GuildSettingsCache
+from imagecache import attach_images
+
 LETTERBOXD_COLOR = discord.Color.from_rgb(0, 210, 120)
 LETTERBOXD_NAMESPACES = {
     "letterboxd": "https://letterboxd.com",
@@ -18,12 +32,210 @@ STAR_FULL = "\u2605"
 STAR_HALF = "\u00BD"
 STAR_EMPTY = "\u2606"
 MAX_REVIEW_LENGTH = 400
+LETTERBOXD_HOST = "letterboxd.com"
+POLL_CONCURRENCY = int(os.getenv("LETTERBOXD_POLL_CONCURRENCY", "8"))
+REQUESTS_PER_SECOND = float(os.getenv("LETTERBOXD_REQUESTS_PER_SECOND", "4"))
+FEED_CHUNK_SIZE = 8192
+
+# Each feed is polled POLLS_PER_POST times per expected gap between its posts, within these bounds.
+# Someone logging a film a day keeps the old 30-minute pace; busier feeds go faster, quieter ones slower.
+DEFAULT_POLL_SECONDS = 30 * 60
+MIN_POLL_SECONDS = float(os.getenv("LETTERBOXD_MIN_POLL_MINUTES", "5")) * 60
+MAX_POLL_SECONDS = float(os.getenv("LETTERBOXD_MAX_POLL_MINUTES", "360")) * 60
+POLLS_PER_POST = 48
+GAP_SMOOTHING = 0.3  # weight of the newest gap in the moving average
+POST_DELAY_SAMPLES = 200
+
+SEEN_GUIDS_PER_USER = 200  # a feed holds 50 items, so this is several feeds' worth of history
+BLOOM_BITS = 1 << 20
+BLOOM_HASHES = 4
+ENTRY_BATCH_SIZE = 500
+MAX_IMPORT_BYTES = 10 * 1024 * 1024
+STATS_LIMIT = 5
+STATS_MIN_RATED = 5  # ratings a member needs before they appear on the average-rating board
+
+IMG_SRC_RE = re.compile(r'<img\s+src="([^"]+)"')
+TAG_RE = re.compile(r'<[^>]+>')
+WATCHED_ON_RE = re.compile(r'Watched on \w+ (\w+) (\d{1,2}), (\d{4})')
+SPOILER_NOTICE = 'This review may contain spoilers.'
+MONTH_NUMBERS = {name: number for number, name in enumerate(calendar.month_name) if name}
+
+
+class DescriptionParts:
+    """What a feed item's description HTML carries, pulled out in one pass."""
+
+    __slots__ = ('poster_url', 'review_text', 'has_spoilers', 'watched_date')
+
+    def __init__(
+        self,
+        poster_url: Optional[str],
+        review_text: Optional[str],
+        has_spoilers: bool,
+        watched_date: Optional[datetime.date],
+    ) -> None:
+        self.poster_url = poster_url
+        self.review_text = review_text
+        self.has_spoilers = has_spoilers
+        self.watched_date = watched_date
+
+    @classmethod
+    def parse(cls, description: str) -> 'DescriptionParts':
+        poster_url = None
+        has_spoilers = False
+        watched_date = None
+        review_parts = []
+
+        # Paragraphs are never nested, so plain str.find walks them faster than a lazy regex can
+        position = 0
+        while True:
+            start = description.find('<p>', position)
+            if start == -1:
+                break
+            end = description.find('</p>', start + 3)
+            if end == -1:
+                break
+            p = description[start + 3:end]
+            position = end + 4
+
+            if '<img' in p:
+                if poster_url is None:
+                    img = IMG_SRC_RE.search(p)
+                    if img:
+                        poster_url = img.group(1)
+                continue
+            stripped = p.strip()
+            if stripped.startswith('Watched on'):
+                watched = WATCHED_ON_RE.match(stripped)
+                if watched:
+                    month, day, year = watched.groups()
+                    try:
+                        watched_date = datetime.date(int(year), MONTH_NUMBERS[month], int(day))
+                    except (KeyError, ValueError):
+                        pass
+                continue
+            clean = TAG_RE.sub('', p).strip() if '<' in p else stripped
+            if clean:
+                if clean == SPOILER_NOTICE:
+                    has_spoilers = True
+                review_parts.append(clean)
+
+        # The poster is normally in the first paragraph, but fall back to anywhere in the markup
+        if poster_url is None and '<img' in description:
+            img = IMG_SRC_RE.search(description)
+            if img:
+                poster_url = img.group(1)
+
+        review = '\n\n'.join(review_parts) or None
+        if review and len(review) > MAX_REVIEW_LENGTH:
+            review = review[:MAX_REVIEW_LENGTH].rsplit(' ', 1)[0] + '...'
+
+        return cls(poster_url, review, has_spoilers, watched_date)
+
+
+def _guid_hash(guid: str) -> int:
+    return int.from_bytes(hashlib.blake2b(guid.encode(), digest_size=8).digest(), 'big', signed=True)
+
+
+class SeenGuidIndex:
+    """Bounded record of the feed items each subscriber has already been shown.
+
+    GUIDs are kept as 64-bit hashes in SQLite, at most SEEN_GUIDS_PER_USER per
+    subscriber. An in-memory Bloom filter answers most lookups on its own: a
+    miss means the item was never seen, and only hits are confirmed with a
+    query, since pruned entries still leave their bits set.
+    """
+
+    def __init__(self, db: Database) -> None:
+        self.db = db
+        self._bits = bytearray(BLOOM_BITS // 8)
+
+    async def load(self) -> None:
+        async with self.db.execute('SELECT guild_id, user_id, guid_hash FROM letterboxd_seen') as cursor:
+            rows = await cursor.fetchall()
+        for row in rows:
+            self._add_to_filter(row['guild_id'], row['user_id'], row['guid_hash'])
+
+    @staticmethod
+    def _positions(guild_id: int, user_id: int, guid_hash: int) -> list[int]:
+        digest = hashlib.blake2b(f'{guild_id}:{user_id}:{guid_hash}'.encode(), digest_size=4 * BLOOM_HASHES).digest()
+        return [int.from_bytes(digest[i:i + 4], 'big') % BLOOM_BITS for i in range(0, len(digest), 4)]
+
+    def _add_to_filter(self, guild_id: int, user_id: int, guid_hash: int) -> None:
+        for position in self._positions(guild_id, user_id, guid_hash):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def _might_contain(self, guild_id: int, user_id: int, guid_hash: int) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(guild_id, user_id, guid_hash)
+        )
+
+    async def seen(self, guild_id: int, user_id: int, guids: List[str]) -> set[str]:
+        """Returns the subset of guids this subscriber has already been shown."""
+        candidates = {}
+        for guid in guids:
+            guid_hash = _guid_hash(guid)
+            if self._might_contain(guild_id, user_id, guid_hash):
+                candidates[guid] = guid_hash
+        if not candidates:
+            return set()
+
+        placeholders = ', '.join('?' for _ in candidates)
+        async with self.db.execute(
+            f'SELECT guid_hash FROM letterboxd_seen WHERE guild_id = ? AND user_id = ? AND guid_hash IN ({placeholders})',
+            (guild_id, user_id, *candidates.values())
+        ) as cursor:
+            found = {row['guid_hash'] for row in await cursor.fetchall()}
+        return {guid for guid, guid_hash in candidates.items() if guid_hash in found}
+
+    async def add(self, guild_id: int, user_id: int, guids: List[str]) -> None:
+        now = time.time()
+        rows = [(guild_id, user_id, _guid_hash(guid), now) for guid in guids]
+        # Replacing refreshes seen_at, so items still in the feed are never the ones pruned
+        await self.db.write_many(
+            'INSERT OR REPLACE INTO letterboxd_seen (guild_id, user_id, guid_hash, seen_at) VALUES (?, ?, ?, ?)',
+            rows
+        )
+        for _, _, guid_hash, _ in rows:
+            self._add_to_filter(guild_id, user_id, guid_hash)
+        await self.db.write(
+            'DELETE FROM letterboxd_seen WHERE guild_id = ? AND user_id = ? AND guid_hash NOT IN ('
+            'SELECT guid_hash FROM letterboxd_seen WHERE guild_id = ? AND user_id = ? ORDER BY seen_at DESC LIMIT ?)',
+            (guild_id, user_id, guild_id, user_id, SEEN_GUIDS_PER_USER)
+        )
+
+    async def forget(self, guild_id: int, user_id: int) -> None:
+        await self.db.write('DELETE FROM letterboxd_seen WHERE guild_id = ? AND user_id = ?', (guild_id, user_id))
+
+
+class HostRateLimiter:
+    """Spaces out requests per host so a poll cycle can't burst past a fixed rate."""
+
+    def __init__(self, requests_per_second: float) -> None:
+        self.interval = 1 / requests_per_second if requests_per_second > 0 else 0.0
+        self._next_slot: dict[str, float] = {}
+
+    async def acquire(self, host: str) -> None:
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(host, now))
+        self._next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
 
 
 class LetterboxdCog(commands.Cog):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
-        self.db: Optional[aiosqlite.Connection] = None
+        self.db: Optional[Database] = None
+        self.channels: Optional[GuildSettingsCache] = None
+        self.seen_guids: Optional[SeenGuidIndex] = None
+        self.rate_limiter = HostRateLimiter(REQUESTS_PER_SECOND)
+        self.last_cycle_seconds: Optional[float] = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # letterboxd_username (lowercased) -> row of letterboxd_schedule
+        self.schedule: dict[str, dict[str, Optional[float]]] = {}
+        self.post_delays: collections.deque[float] = collections.deque(maxlen=POST_DELAY_SAMPLES)
 
     letterboxd_group = app_commands.Group(
         name='letterboxd',
@@ -31,50 +243,166 @@ class LetterboxdCog(commands.Cog):
     )
 
     async def cog_load(self) -> None:
-        self.db = await aiosqlite.connect(DB_PATH)
-        self.db.row_factory = aiosqlite.Row
+        self.db = self.bot.db
         await self._create_tables()
+        self.channels = GuildSettingsCache(self.db, 'letterboxd_channels', ('channel_id',))
+        await self.channels.load()
+        self.seen_guids = SeenGuidIndex(self.db)
+        await self.seen_guids.load()
+        await self._rebuild_stats_if_stale()
+        async with self.db.execute(
+            'SELECT letterboxd_username, interval_seconds, next_poll_at, mean_gap_seconds, last_item_at '
+            'FROM letterboxd_schedule'
+        ) as cursor:
+            rows = await cursor.fetchall()
+        self.schedule = {row['letterboxd_username']: dict(row) for row in rows}
         self.poll_feeds_task.start()
 
     async def cog_unload(self) -> None:
         self.poll_feeds_task.cancel()
-        if self.db:
-            await self.db.close()
 
     async def _create_tables(self) -> None:
-        await self.db.execute('''
-            CREATE TABLE IF NOT EXISTS letterboxd_users (
-                guild_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                letterboxd_username TEXT NOT NULL,
-                last_guid TEXT,
-                PRIMARY KEY (guild_id, user_id)
-            )
-        ''')
-        await self.db.execute('''
-            CREATE TABLE IF NOT EXISTS letterboxd_channels (
-                guild_id INTEGER PRIMARY KEY,
-                channel_id INTEGER NOT NULL
-            )
-        ''')
-        await self.db.commit()
+        await self.db.create_tables(
+            '''
+                CREATE TABLE IF NOT EXISTS letterboxd_users (
+                    guild_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    letterboxd_username TEXT NOT NULL,
+                    last_guid TEXT,
+                    PRIMARY KEY (guild_id, user_id)
+                )
+            ''',
+            '''
+                CREATE TABLE IF NOT EXISTS letterboxd_feed_cache (
+                    letterboxd_username TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT
+                )
+            ''',
+            '''
+                CREATE TABLE IF NOT EXISTS letterboxd_schedule (
+                    letterboxd_username TEXT PRIMARY KEY,
+                    interval_seconds REAL NOT NULL,
+                    next_poll_at REAL NOT NULL,
+                    mean_gap_seconds REAL,
+                    last_item_at REAL
+                )
+            ''',
+            '''
+                CREATE TABLE IF NOT EXISTS letterboxd_seen (
+                    guild_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    guid_hash INTEGER NOT NULL,
+                    seen_at REAL NOT NULL,
+                    PRIMARY KEY (guild_id, user_id, guid_hash)
+                ) WITHOUT ROWID
+            ''',
+            '''
+                CREATE TABLE IF NOT EXISTS letterboxd_entries (
+                    guild_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    film_title TEXT NOT NULL,
+                    film_year INTEGER NOT NULL,
+                    watched_date TEXT NOT NULL,
+                    rating REAL,
+                    rewatch INTEGER NOT NULL DEFAULT 0,
+                    has_review INTEGER NOT NULL DEFAULT 0,
+                    link TEXT,
+                    source TEXT NOT NULL,
+                    UNIQUE (guild_id, user_id, film_title, film_year, watched_date)
+                )
+            ''',
+            '''
+                CREATE TABLE IF NOT EXISTS letterboxd_monthly_counts (
+                    guild_id INTEGER NOT NULL,
+                    month TEXT NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    films INTEGER NOT NULL,
+                    PRIMARY KEY (guild_id, month, user_id)
+                ) WITHOUT ROWID
+            ''',
+            '''
+                CREATE TABLE IF NOT EXISTS letterboxd_member_totals (
+                    guild_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    films INTEGER NOT NULL,
+                    rated INTEGER NOT NULL,
+                    rating_sum REAL NOT NULL,
+                    PRIMARY KEY (guild_id, user_id)
+                ) WITHOUT ROWID
+            ''',
+            '''
+                CREATE TABLE IF NOT EXISTS letterboxd_film_counts (
+                    guild_id INTEGER NOT NULL,
+                    film_title TEXT NOT NULL,
+                    film_year INTEGER NOT NULL,
+                    watches INTEGER NOT NULL,
+                    PRIMARY KEY (guild_id, film_title, film_year)
+                ) WITHOUT ROWID
+            ''',
+            '''
+                CREATE INDEX IF NOT EXISTS idx_letterboxd_film_counts_watches
+                ON letterboxd_film_counts (guild_id, watches DESC)
+            ''',
+            # The aggregates follow letterboxd_entries inside the same transaction as each insert or delete
+            '''
+                CREATE TRIGGER IF NOT EXISTS letterboxd_entries_counted AFTER INSERT ON letterboxd_entries
+                BEGIN
+                    INSERT INTO letterboxd_monthly_counts (guild_id, month, user_id, films)
+                    VALUES (NEW.guild_id, substr(NEW.watched_date, 1, 7), NEW.user_id, 1)
+                    ON CONFLICT (guild_id, month, user_id) DO UPDATE SET films = films + 1;
+
+                    INSERT INTO letterboxd_member_totals (guild_id, user_id, films, rated, rating_sum)
+                    VALUES (NEW.guild_id, NEW.user_id, 1, NEW.rating IS NOT NULL, COALESCE(NEW.rating, 0))
+                    ON CONFLICT (guild_id, user_id) DO UPDATE SET
+                        films = films + 1,
+                        rated = rated + excluded.rated,
+                        rating_sum = rating_sum + excluded.rating_sum;
+
+                    INSERT INTO letterboxd_film_counts (guild_id, film_title, film_year, watches)
+                    VALUES (NEW.guild_id, NEW.film_title, NEW.film_year, 1)
+                    ON CONFLICT (guild_id, film_title, film_year) DO UPDATE SET watches = watches + 1;
+                END
+            ''',
+            '''
+                CREATE TRIGGER IF NOT EXISTS letterboxd_entries_uncounted AFTER DELETE ON letterboxd_entries
+                BEGIN
+                    UPDATE letterboxd_monthly_counts SET films = films - 1
+                    WHERE guild_id = OLD.guild_id AND month = substr(OLD.watched_date, 1, 7) AND user_id = OLD.user_id;
+                    DELETE FROM letterboxd_monthly_counts
+                    WHERE guild_id = OLD.guild_id AND month = substr(OLD.watched_date, 1, 7) AND user_id = OLD.user_id
+                    AND films <= 0;
+
+                    UPDATE letterboxd_member_totals SET
+                        films = films - 1,
+                        rated = rated - (OLD.rating IS NOT NULL),
+                        rating_sum = rating_sum - COALESCE(OLD.rating, 0)
+                    WHERE guild_id = OLD.guild_id AND user_id = OLD.user_id;
+                    DELETE FROM letterboxd_member_totals
+                    WHERE guild_id = OLD.guild_id AND user_id = OLD.user_id AND films <= 0;
+
+                    UPDATE letterboxd_film_counts SET watches = watches - 1
+                    WHERE guild_id = OLD.guild_id AND film_title = OLD.film_title AND film_year = OLD.film_year;
+                    DELETE FROM letterboxd_film_counts
+                    WHERE guild_id = OLD.guild_id AND film_title = OLD.film_title AND film_year = OLD.film_year
+                    AND watches <= 0;
+                END
+            ''',
+            '''
+                CREATE TABLE IF NOT EXISTS letterboxd_channels (
+                    guild_id INTEGER PRIMARY KEY,
+                    channel_id INTEGER NOT NULL
+                )
+            ''',
+        )
 
     async def _get_letterboxd_channel(self, guild: discord.Guild) -> Optional[discord.TextChannel]:
-        async with self.db.execute(
-            'SELECT channel_id FROM letterboxd_channels WHERE guild_id = ?',
-            (guild.id,)
-        ) as cursor:
-            row = await cursor.fetchone()
-
-        if row:
-            channel = guild.get_channel(row['channel_id'])
+        settings = self.channels.get(guild.id)
+        if settings:
+            channel = guild.get_channel(settings['channel_id'])
             if channel:
                 return channel
-            await self.db.execute(
-                'DELETE FROM letterboxd_channels WHERE guild_id = ?',
-                (guild.id,)
-            )
-            await self.db.commit()
+            await self.channels.delete(guild.id)
 
         return guild.system_channel
 
@@ -85,34 +413,6 @@ class LetterboxdCog(commands.Cog):
         empty_stars = 5 - full_stars - (1 if has_half else 0)
         return STAR_FULL * full_stars + (STAR_HALF if has_half else '') + STAR_EMPTY * empty_stars
 
-    @staticmethod
-    def _extract_poster_url(description: str) -> Optional[str]:
-        match = re.search(r'<img\s+src="([^"]+)"', description)
-        return match.group(1) if match else None
-
-    @staticmethod
-    def _extract_review_text(description: str) -> Optional[str]:
-        paragraphs = re.findall(r'<p>(.*?)</p>', description, re.DOTALL)
-
-        review_parts = []
-        for p in paragraphs:
-            if '<img' in p:
-                continue
-            if p.strip().startswith('Watched on'):
-                continue
-            clean = re.sub(r'<[^>]+>', '', p).strip()
-            if clean:
-                review_parts.append(clean)
-
-        review = '\n\n'.join(review_parts)
-        if not review:
-            return None
-
-        if len(review) > MAX_REVIEW_LENGTH:
-            review = review[:MAX_REVIEW_LENGTH].rsplit(' ', 1)[0] + '...'
-
-        return review
-
     @staticmethod
     def _build_embed(
         member: discord.Member,
@@ -153,33 +453,224 @@ class LetterboxdCog(commands.Cog):
 
         return embed
 
-    @staticmethod
-    async def _fetch_and_parse_feed(username: str) -> Optional[List[ET.Element]]:
+    async def _fetch_and_parse_feed(
+        self,
+        username: str,
+        stop_guids: Optional[set[str]] = None,
+        conditional: bool = True,
+        remember: bool = True,
+    ) -> Optional[List[ET.Element]]:
+        """Returns the feed's items, an empty list if unchanged since the last fetch, or None on failure.
+
+        The body is parsed as it downloads. With stop_guids, both stop once every one of those
+        GUIDs has been seen (or after the first item if the set is empty), so an unchanged
+        feed costs one item rather than the whole document. conditional=False always
+        downloads the feed, even if it hasn't changed since the poller last saw it.
+        remember=False leaves the stored validators alone, for fetches made outside the poller.
+        """
         url = f"https://letterboxd.com/{username}/rss/"
+        cache_key = username.lower()
+
+        async with self.db.execute(
+            'SELECT etag, last_modified FROM letterboxd_feed_cache WHERE letterboxd_username = ?',
+            (cache_key,)
+        ) as cursor:
+            validators = await cursor.fetchone()
+
+        headers = {}
+        if validators and conditional:
+            if validators['etag']:
+                headers['If-None-Match'] = validators['etag']
+            if validators['last_modified']:
+                headers['If-Modified-Since'] = validators['last_modified']
+
+        parser = ET.XMLPullParser(events=('start', 'end'))
+        channel = None
+        items = []
+        remaining = set(stop_guids) if stop_guids is not None else None
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=aiohttp.ClientTimeout(total=15)) as resp:
-                    if resp.status == 404:
-                        return None
-                    if resp.status != 200:
-                        print(f'[LETTERBOXD] Non-200 response ({resp.status}) for {username}')
-                        return None
-                    text = await resp.text()
+            async with self.bot.http_session.get(
+                url, headers=headers, timeout=aiohttp.ClientTimeout(total=15)
+            ) as resp:
+                if resp.status == 304:
+                    self.cache_hits += 1
+                    return []
+                if resp.status == 404:
+                    return None
+                if resp.status != 200:
+                    print(f'[LETTERBOXD] Non-200 response ({resp.status}) for {username}')
+                    return None
+                etag = resp.headers.get('ETag')
+                last_modified = resp.headers.get('Last-Modified')
+                self.cache_misses += 1
+
+                # Leaving the response early closes the connection, so the rest is never downloaded
+                finished = False
+                async for chunk in resp.content.iter_chunked(FEED_CHUNK_SIZE):
+                    parser.feed(chunk)
+                    for event, element in parser.read_events():
+                        if event == 'start':
+                            if element.tag == 'channel' and channel is None:
+                                channel = element
+                            continue
+                        if element.tag != 'item' or channel is None:
+                            continue
+                        items.append(element)
+                        # Detach finished items so the tree never holds more than the one being parsed
+                        channel.remove(element)
+                        if remaining is not None:
+                            remaining.discard(element.findtext('guid'))
+                            if not remaining:
+                                finished = True
+                                break
+                    if finished:
+                        break
+                else:
+                    parser.close()
         except (aiohttp.ClientError, TimeoutError) as e:
             print(f'[LETTERBOXD] Connection error fetching {username}: {e}')
             return None
-
-        try:
-            root = ET.fromstring(text)
         except ET.ParseError as e:
             print(f'[LETTERBOXD] XML parse error for {username}: {e}')
             return None
 
-        channel = root.find('channel')
         if channel is None:
             return None
 
-        return channel.findall('item')
+        # Only remember validators for documents that parsed, so a bad response is never pinned
+        if remember and (etag or last_modified):
+            await self.db.write(
+                'INSERT OR REPLACE INTO letterboxd_feed_cache (letterboxd_username, etag, last_modified) '
+                'VALUES (?, ?, ?)',
+                (cache_key, etag, last_modified)
+            )
+
+        return items
+
+    async def _rebuild_stats_if_stale(self) -> None:
+        """Recomputes the aggregates from scratch when they don't account for every entry.
+
+        Only needed for entries stored before the aggregate tables and their triggers existed.
+        """
+        async with self.db.execute(
+            'SELECT (SELECT COUNT(*) FROM letterboxd_entries) AS entries, '
+            '(SELECT COALESCE(SUM(films), 0) FROM letterboxd_member_totals) AS counted'
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row['entries'] == row['counted']:
+            return
+
+        print(f'[LETTERBOXD] Rebuilding stats for {row["entries"]} diary entries')
+        await asyncio.gather(
+            self.db.write('DELETE FROM letterboxd_monthly_counts'),
+            self.db.write('DELETE FROM letterboxd_member_totals'),
+            self.db.write('DELETE FROM letterboxd_film_counts'),
+            self.db.write(
+                'INSERT INTO letterboxd_monthly_counts (guild_id, month, user_id, films) '
+                'SELECT guild_id, substr(watched_date, 1, 7), user_id, COUNT(*) FROM letterboxd_entries GROUP BY 1, 2, 3'
+            ),
+            self.db.write(
+                'INSERT INTO letterboxd_member_totals (guild_id, user_id, films, rated, rating_sum) '
+                'SELECT guild_id, user_id, COUNT(*), COUNT(rating), COALESCE(SUM(rating), 0) '
+                'FROM letterboxd_entries GROUP BY 1, 2'
+            ),
+            self.db.write(
+                'INSERT INTO letterboxd_film_counts (guild_id, film_title, film_year, watches) '
+                'SELECT guild_id, film_title, film_year, COUNT(*) FROM letterboxd_entries GROUP BY 1, 2, 3'
+            ),
+        )
+
+    async def _top_monthly_loggers(self, guild_id: int, month: str) -> list[aiosqlite.Row]:
+        async with self.db.execute(
+            'SELECT user_id, films FROM letterboxd_monthly_counts WHERE guild_id = ? AND month = ? '
+            'ORDER BY films DESC LIMIT ?',
+            (guild_id, month, STATS_LIMIT)
+        ) as cursor:
+            return await cursor.fetchall()
+
+    async def _top_average_ratings(self, guild_id: int) -> list[aiosqlite.Row]:
+        async with self.db.execute(
+            'SELECT user_id, rating_sum / rated AS average, rated FROM letterboxd_member_totals '
+            'WHERE guild_id = ? AND rated >= ? ORDER BY average DESC LIMIT ?',
+            (guild_id, STATS_MIN_RATED, STATS_LIMIT)
+        ) as cursor:
+            return await cursor.fetchall()
+
+    async def _most_watched_films(self, guild_id: int) -> list[aiosqlite.Row]:
+        async with self.db.execute(
+            'SELECT film_title, film_year, watches FROM letterboxd_film_counts WHERE guild_id = ? '
+            'ORDER BY watches DESC LIMIT ?',
+            (guild_id, STATS_LIMIT)
+        ) as cursor:
+            return await cursor.fetchall()
+
+    @staticmethod
+    def _entry_from_item(item: ET.Element) -> Optional[tuple]:
+        """Diary fields of a feed item, or None for items that aren't diary entries (such as lists)."""
+        film_title = item.findtext('letterboxd:filmTitle', namespaces=LETTERBOXD_NAMESPACES)
+        watched_date = item.findtext('letterboxd:watchedDate', namespaces=LETTERBOXD_NAMESPACES)
+        if not film_title or not watched_date:
+            return None
+        film_year = item.findtext('letterboxd:filmYear', namespaces=LETTERBOXD_NAMESPACES) or ''
+        rating_text = item.findtext('letterboxd:memberRating', namespaces=LETTERBOXD_NAMESPACES)
+        try:
+            rating = float(rating_text) if rating_text else None
+        except ValueError:
+            rating = None
+        return (
+            film_title,
+            int(film_year) if film_year.isdigit() else 0,
+            watched_date,
+            rating,
+            item.findtext('letterboxd:rewatch', namespaces=LETTERBOXD_NAMESPACES) == 'Yes',
+            (item.findtext('guid') or '').startswith('letterboxd-review-'),
+            item.findtext('link'),
+        )
+
+    @staticmethod
+    def _entry_from_csv_row(row: dict[str, str]) -> Optional[tuple]:
+        """Diary fields of a row from a Letterboxd export's diary.csv or reviews.csv."""
+        film_title = row.get('Name')
+        watched_date = row.get('Watched Date') or row.get('Date')
+        if not film_title or not watched_date:
+            return None
+        film_year = row.get('Year') or ''
+        try:
+            rating = float(row['Rating']) if row.get('Rating') else None
+        except ValueError:
+            rating = None
+        return (
+            film_title,
+            int(film_year) if film_year.isdigit() else 0,
+            watched_date,
+            rating,
+            row.get('Rewatch') == 'Yes',
+            bool(row.get('Review')),
+            row.get('Letterboxd URI'),
+        )
+
+    async def _store_entries(self, guild_id: int, user_id: int, entries, source: str) -> int:
+        """Inserts diary entries in batches, skipping ones already stored. Returns how many were new."""
+        inserted = 0
+        batch = []
+        for entry in entries:
+            if entry is None:
+                continue
+            batch.append((guild_id, user_id, *entry, source))
+            if len(batch) >= ENTRY_BATCH_SIZE:
+                inserted += await self._write_entries(batch)
+                batch = []
+        if batch:
+            inserted += await self._write_entries(batch)
+        return inserted
+
+    async def _write_entries(self, batch: list[tuple]) -> int:
+        return await self.db.write_many(
+            'INSERT OR IGNORE INTO letterboxd_entries '
+            '(guild_id, user_id, film_title, film_year, watched_date, rating, rewatch, has_review, link, source) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            batch
+        )
 
     @staticmethod
     def _qualifies_for_post(item: ET.Element) -> bool:
@@ -200,21 +691,122 @@ class LetterboxdCog(commands.Cog):
 
         return False
 
-    @tasks.loop(minutes=30)
+    @staticmethod
+    def _item_timestamp(item: ET.Element) -> Optional[float]:
+        pub_date = item.findtext('pubDate')
+        if not pub_date:
+            return None
+        try:
+            return email.utils.parsedate_to_datetime(pub_date).timestamp()
+        except (TypeError, ValueError):
+            return None
+
+    async def _reschedule(self, username: str, items: Optional[List[ET.Element]]) -> None:
+        """Learns a feed's posting rate from its items and picks when to poll it next."""
+        now = time.time()
+        entry = self.schedule[username]
+        last_item_at = entry['last_item_at']
+        mean_gap = entry['mean_gap_seconds']
+
+        new_times = sorted(
+            timestamp for timestamp in map(self._item_timestamp, items or [])
+            if timestamp is not None and (last_item_at is None or timestamp > last_item_at)
+        )
+        for timestamp in new_times:
+            if last_item_at is not None:
+                gap = timestamp - last_item_at
+                mean_gap = gap if mean_gap is None else mean_gap + GAP_SMOOTHING * (gap - mean_gap)
+            last_item_at = timestamp
+
+        if items is None:
+            # A failed fetch teaches nothing, so keep the current pace
+            interval = entry['interval_seconds']
+        else:
+            # A feed that has been quiet for longer than its usual gap backs off as the silence grows
+            estimates = [value for value in (mean_gap, now - last_item_at if last_item_at else None) if value]
+            expected_gap = max(estimates) if estimates else DEFAULT_POLL_SECONDS * POLLS_PER_POST
+            interval = min(max(expected_gap / POLLS_PER_POST, MIN_POLL_SECONDS), MAX_POLL_SECONDS)
+
+        entry.update(
+            interval_seconds=interval,
+            next_poll_at=now + interval,
+            mean_gap_seconds=mean_gap,
+            last_item_at=last_item_at,
+        )
+        await self.db.write(
+            'INSERT OR REPLACE INTO letterboxd_schedule '
+            '(letterboxd_username, interval_seconds, next_poll_at, mean_gap_seconds, last_item_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (username, interval, now + interval, mean_gap, last_item_at)
+        )
+
+    async def _postpone(self, usernames: set[str]) -> None:
+        now = time.time()
+        for username in usernames:
+            self.schedule[username]['next_poll_at'] = now + self.schedule[username]['interval_seconds']
+        if usernames:
+            await self.db.write_many(
+                'INSERT OR REPLACE INTO letterboxd_schedule '
+                '(letterboxd_username, interval_seconds, next_poll_at, mean_gap_seconds, last_item_at) '
+                'VALUES (:letterboxd_username, :interval_seconds, :next_poll_at, :mean_gap_seconds, :last_item_at)',
+                [self.schedule[username] for username in usernames]
+            )
+
+    async def _due_feeds(self, usernames: set[str]) -> set[str]:
+        now = time.time()
+        unfollowed = set(self.schedule) - usernames
+        if unfollowed:
+            for username in unfollowed:
+                del self.schedule[username]
+            await self.db.write_many(
+                'DELETE FROM letterboxd_schedule WHERE letterboxd_username = ?',
+                [(username,) for username in unfollowed]
+            )
+        for username in usernames - set(self.schedule):
+            # Spread new feeds over the default interval instead of polling them all at once
+            phase = zlib.crc32(username.encode()) % DEFAULT_POLL_SECONDS
+            self.schedule[username] = {
+                'letterboxd_username': username,
+                'interval_seconds': DEFAULT_POLL_SECONDS,
+                'next_poll_at': now + phase,
+                'mean_gap_seconds': None,
+                'last_item_at': None,
+            }
+        return {username for username in usernames if self.schedule[username]['next_poll_at'] <= now}
+
+    @tasks.loop(minutes=1)
     async def poll_feeds_task(self) -> None:
         await self.bot.wait_until_ready()
+        started = time.perf_counter()
 
         async with self.db.execute(
             'SELECT guild_id, user_id, letterboxd_username, last_guid FROM letterboxd_users'
         ) as cursor:
             rows = await cursor.fetchall()
 
+        # Each feed has its own next poll time; most ticks find only a few of them due
+        due = await self._due_feeds({row['letterboxd_username'].lower() for row in rows})
+        rows = [row for row in rows if row['letterboxd_username'].lower() in due]
+        if not rows:
+            return
+
+        # Group subscriptions by feed so each username is fetched once per cycle
+        wanted: dict[int, list[int]] = {}
+        for row in rows:
+            wanted.setdefault(row['guild_id'], []).append(row['user_id'])
+        members: dict[int, dict[int, discord.Member]] = {}
+        for guild_id, user_ids in wanted.items():
+            guild = self.bot.get_guild(guild_id)
+            if guild:
+                members[guild_id] = await self.bot.get_or_query_members(guild, user_ids)
+
+        feeds: dict[str, list[tuple[aiosqlite.Row, discord.Member, discord.TextChannel]]] = {}
         for row in rows:
             guild = self.bot.get_guild(row['guild_id'])
             if not guild:
                 continue
 
-            member = guild.get_member(row['user_id'])
+            member = members[guild.id].get(row['user_id'])
             if not member:
                 continue
 
@@ -223,85 +815,141 @@ class LetterboxdCog(commands.Cog):
                 print(f'[LETTERBOXD] No channel available for guild {guild.name} [{guild.id}]')
                 continue
 
-            items = await self._fetch_and_parse_feed(row['letterboxd_username'])
-            if items is None or not items:
-                continue
+            feeds.setdefault(row['letterboxd_username'].lower(), []).append((row, member, channel))
 
-            last_guid = row['last_guid']
+        # Feeds nobody can receive right now wait a full interval, like any other poll
+        await self._postpone(due - set(feeds))
+        if not feeds:
+            return
 
-            # Collect new items (feed is newest-first, stop at last seen guid)
-            new_items = []
-            for item in items:
-                guid = item.findtext('guid')
-                if guid == last_guid:
-                    break
-                new_items.append(item)
+        # Fetch concurrently, but hand results to the posting logic in row order
+        semaphore = asyncio.Semaphore(POLL_CONCURRENCY)
+
+        async def fetch(username: str, subscribers: list) -> Optional[List[ET.Element]]:
+            # Parsing can stop once every subscriber's cursor has gone by, except on a feed's first
+            # poll, where the whole feed seeds its posting rate
+            stop_guids = None
+            if self.schedule[username]['last_item_at'] is not None:
+                stop_guids = {row['last_guid'] for row, _, _ in subscribers if row['last_guid']}
+            # A new follower has no cursor yet and wants the latest entry, even if the feed is unchanged
+            conditional = all(row['last_guid'] for row, _, _ in subscribers)
+            async with semaphore:
+                await self.rate_limiter.acquire(LETTERBOXD_HOST)
+                return await self._fetch_and_parse_feed(
+                    subscribers[0][0]['letterboxd_username'], stop_guids, conditional=conditional
+                )
 
-            if not new_items:
-                continue
+        fetches = [asyncio.create_task(fetch(username, subscribers)) for username, subscribers in feeds.items()]
+        try:
+            for (username, subscribers), fetch_task in zip(feeds.items(), fetches):
+                items = await fetch_task
+                await self._reschedule(username, items)
+                if items is None or not items:
+                    continue
+                # Each guild applies its own last_guid cursor to the shared parse
+                for row, member, channel in subscribers:
+                    await self._post_new_items(row, member, channel, items)
+        finally:
+            for fetch_task in fetches:
+                fetch_task.cancel()
+
+        subscriptions = sum(len(subscribers) for subscribers in feeds.values())
+        self.last_cycle_seconds = time.perf_counter() - started
+        median_delay = f'{statistics.median(self.post_delays) / 60:.0f}m' if self.post_delays else 'n/a'
+        print(
+            f'[LETTERBOXD] Poll cycle finished: {len(feeds)} feeds for {subscriptions} subscriptions '
+            f'in {self.last_cycle_seconds:.2f}s (feed cache: {self.cache_hits} hits, {self.cache_misses} misses, '
+            f'median time to post: {median_delay})'
+        )
 
-            # First follow: only post the most recent entry to avoid flooding
-            if last_guid is None:
-                new_items = [new_items[0]]
+    async def _post_new_items(
+        self,
+        row: aiosqlite.Row,
+        member: discord.Member,
+        channel: discord.TextChannel,
+        items: List[ET.Element],
+    ) -> None:
+        guild = member.guild
+        last_guid = row['last_guid']
+        guids = [item.findtext('guid') or '' for item in items]
+        already_seen = await self.seen_guids.seen(guild.id, member.id, guids)
+
+        # Feed is newest-first. Items already shown are skipped wherever they sit, so a deleted or
+        # edited item can't make everything behind it look new. Walking stops at last_guid too,
+        # which covers subscriptions that predate the seen index.
+        new_items = []
+        for item, guid in zip(items, guids):
+            if guid == last_guid:
+                break
+            if guid not in already_seen:
+                new_items.append(item)
 
-            # Reverse to post oldest first (chronological order)
-            new_items.reverse()
+        # First follow: only post the most recent entry to avoid flooding
+        if last_guid is None:
+            new_items = new_items[:1]
 
-            for item in new_items:
-                if not self._qualifies_for_post(item):
-                    continue
+        # Reverse to post oldest first (chronological order)
+        new_items.reverse()
 
-                film_title = item.findtext(
-                    'letterboxd:filmTitle',
-                    namespaces=LETTERBOXD_NAMESPACES
-                ) or 'Unknown Title'
-                film_year = item.findtext(
-                    'letterboxd:filmYear',
-                    namespaces=LETTERBOXD_NAMESPACES
-                ) or '????'
-                rating_text = item.findtext(
-                    'letterboxd:memberRating',
-                    namespaces=LETTERBOXD_NAMESPACES
-                )
-                rating = float(rating_text) if rating_text else None
-                rewatch_text = item.findtext(
-                    'letterboxd:rewatch',
-                    namespaces=LETTERBOXD_NAMESPACES
-                )
-                is_rewatch = rewatch_text == 'Yes'
-                link = item.findtext('link') or ''
-                description = item.findtext('description') or ''
-                poster_url = self._extract_poster_url(description)
-                review_text = self._extract_review_text(description)
-
-                embed = self._build_embed(
-                    member=member,
-                    film_title=film_title,
-                    film_year=film_year,
-                    rating=rating,
-                    review_text=review_text,
-                    poster_url=poster_url,
-                    letterboxd_link=link,
-                    is_rewatch=is_rewatch,
-                )
+        for item in new_items:
+            if not self._qualifies_for_post(item):
+                continue
 
-                try:
-                    await channel.send(embed=embed)
-                except discord.Forbidden:
-                    print(f'[LETTERBOXD] Missing permissions in {channel.name} [{guild.name}]')
-                    break
-                except discord.HTTPException as e:
-                    print(f'[LETTERBOXD] Failed to send embed: {e}')
-                    continue
+            film_title = item.findtext(
+                'letterboxd:filmTitle',
+                namespaces=LETTERBOXD_NAMESPACES
+            ) or 'Unknown Title'
+            film_year = item.findtext(
+                'letterboxd:filmYear',
+                namespaces=LETTERBOXD_NAMESPACES
+            ) or '????'
+            rating_text = item.findtext(
+                'letterboxd:memberRating',
+                namespaces=LETTERBOXD_NAMESPACES
+            )
+            rating = float(rating_text) if rating_text else None
+            rewatch_text = item.findtext(
+                'letterboxd:rewatch',
+                namespaces=LETTERBOXD_NAMESPACES
+            )
+            is_rewatch = rewatch_text == 'Yes'
+            link = item.findtext('link') or ''
+            description = item.findtext('description') or ''
+            parts = DescriptionParts.parse(description)
+
+            embed = self._build_embed(
+                member=member,
+                film_title=film_title,
+                film_year=film_year,
+                rating=rating,
+                review_text=parts.review_text,
+                poster_url=parts.poster_url,
+                letterboxd_link=link,
+                is_rewatch=is_rewatch,
+            )
+            attachments = await attach_images(self.bot.image_cache, embed, thumbnail=parts.poster_url)
 
-            # Update last_guid to newest feed item
-            newest_guid = items[0].findtext('guid')
-            if newest_guid and newest_guid != last_guid:
-                await self.db.execute(
-                    'UPDATE letterboxd_users SET last_guid = ? WHERE guild_id = ? AND user_id = ?',
-                    (newest_guid, row['guild_id'], row['user_id'])
-                )
-                await self.db.commit()
+            queued = await self.bot.dispatcher.enqueue(
+                channel,
+                embed=embed,
+                attachments=attachments,
+                dedup_key=f'letterboxd:{guild.id}:{member.id}:{item.findtext("guid")}',
+            )
+            published_at = self._item_timestamp(item)
+            if queued and published_at:
+                self.post_delays.append(time.time() - published_at)
+
+        # Everything parsed this time counts as shown, including items that didn't qualify for a post
+        await self.seen_guids.add(guild.id, member.id, [guid for guid in guids if guid])
+        await self._store_entries(guild.id, member.id, map(self._entry_from_item, items), 'rss')
+
+        # last_guid stays as the point where the streaming parse can stop
+        newest_guid = items[0].findtext('guid')
+        if newest_guid and newest_guid != last_guid:
+            await self.db.write(
+                'UPDATE letterboxd_users SET last_guid = ? WHERE guild_id = ? AND user_id = ?',
+                (newest_guid, row['guild_id'], row['user_id'])
+            )
 
     @letterboxd_group.command(name='follow', description='Link your Letterboxd profile')
     @app_commands.describe(username='Your Letterboxd username')
@@ -313,7 +961,9 @@ class LetterboxdCog(commands.Cog):
             return
 
         await inter.response.defer(ephemeral=True)
-        items = await self._fetch_and_parse_feed(username)
+        # Only checking that the feed exists, so one item is enough
+        # Its validators aren't kept, or the first scheduled poll would get a 304 and post nothing
+        items = await self._fetch_and_parse_feed(username, stop_guids=set(), remember=False)
         if items is None:
             await inter.followup.send(
                 f'Could not find a Letterboxd profile for **{username}**. '
@@ -322,12 +972,12 @@ class LetterboxdCog(commands.Cog):
             )
             return
 
-        await self.db.execute(
+        await self.db.write(
             'INSERT OR REPLACE INTO letterboxd_users (guild_id, user_id, letterboxd_username, last_guid) '
             'VALUES (?, ?, ?, NULL)',
             (inter.guild.id, inter.user.id, username)
         )
-        await self.db.commit()
+        await self.seen_guids.forget(inter.guild.id, inter.user.id)
 
         await inter.followup.send(
             f'Now following **{username}** on Letterboxd! '
@@ -343,13 +993,17 @@ class LetterboxdCog(commands.Cog):
             )
             return
 
-        result = await self.db.execute(
+        deleted = await self.db.write(
             'DELETE FROM letterboxd_users WHERE guild_id = ? AND user_id = ?',
             (inter.guild.id, inter.user.id)
         )
-        await self.db.commit()
+        await self.seen_guids.forget(inter.guild.id, inter.user.id)
+        await self.db.write(
+            'DELETE FROM letterboxd_entries WHERE guild_id = ? AND user_id = ?',
+            (inter.guild.id, inter.user.id)
+        )
 
-        if result.rowcount > 0:
+        if deleted > 0:
             await inter.response.send_message(
                 'Your Letterboxd profile has been unlinked.', ephemeral=True
             )
@@ -377,21 +1031,13 @@ class LetterboxdCog(commands.Cog):
             return
 
         if channel:
-            await self.db.execute(
-                'INSERT OR REPLACE INTO letterboxd_channels (guild_id, channel_id) VALUES (?, ?)',
-                (inter.guild.id, channel.id)
-            )
-            await self.db.commit()
+            await self.channels.set(inter.guild.id, channel_id=channel.id)
             await inter.response.send_message(
                 f'Letterboxd posts will now be sent to {channel.mention}.',
                 ephemeral=True,
             )
         else:
-            await self.db.execute(
-                'DELETE FROM letterboxd_channels WHERE guild_id = ?',
-                (inter.guild.id,)
-            )
-            await self.db.commit()
+            await self.channels.delete(inter.guild.id)
             system_ch = inter.guild.system_channel
             if system_ch:
                 await inter.response.send_message(
@@ -405,6 +1051,135 @@ class LetterboxdCog(commands.Cog):
                     ephemeral=True,
                 )
 
+    @letterboxd_group.command(name='import', description='Import your Letterboxd diary history (nothing gets posted)')
+    @app_commands.describe(
+        export='diary.csv or reviews.csv from your Letterboxd data export (leave empty to import your RSS feed)'
+    )
+    async def letterboxd_import(
+        self, inter: discord.Interaction, export: Optional[discord.Attachment] = None
+    ) -> None:
+        if not inter.guild:
+            await inter.response.send_message(
+                'This command can only be used in a server.', ephemeral=True
+            )
+            return
+
+        async with self.db.execute(
+            'SELECT letterboxd_username FROM letterboxd_users WHERE guild_id = ? AND user_id = ?',
+            (inter.guild.id, inter.user.id)
+        ) as cursor:
+            row = await cursor.fetchone()
+
+        if not row:
+            await inter.response.send_message(
+                'Link your Letterboxd profile with `/letterboxd follow` first.', ephemeral=True
+            )
+            return
+
+        if export and export.size > MAX_IMPORT_BYTES:
+            await inter.response.send_message(
+                f'That file is too large to import (limit {MAX_IMPORT_BYTES // (1024 * 1024)} MB).', ephemeral=True
+            )
+            return
+
+        await inter.response.defer(ephemeral=True)
+
+        # Imports only fill letterboxd_entries; posting stays with the poller and its seen index
+        if export:
+            try:
+                text = (await export.read()).decode('utf-8-sig')
+            except (discord.HTTPException, UnicodeDecodeError) as e:
+                await inter.followup.send(f'Could not read that file: {e}', ephemeral=True)
+                return
+            reader = csv.DictReader(io.StringIO(text))
+            if not reader.fieldnames or 'Name' not in reader.fieldnames:
+                await inter.followup.send(
+                    'That doesn\'t look like a Letterboxd export. Upload `diary.csv` or `reviews.csv`.',
+                    ephemeral=True,
+                )
+                return
+            entries = [self._entry_from_csv_row(csv_row) for csv_row in reader]
+            source = 'csv'
+        else:
+            # Letterboxd's RSS feed has no paging, so this covers the 50 most recent entries
+            items = await self._fetch_and_parse_feed(row['letterboxd_username'], conditional=False, remember=False)
+            if items is None:
+                await inter.followup.send('Could not fetch your Letterboxd feed right now.', ephemeral=True)
+                return
+            entries = [self._entry_from_item(item) for item in items]
+            source = 'rss'
+
+        found = sum(1 for entry in entries if entry is not None)
+        inserted = await self._store_entries(inter.guild.id, inter.user.id, entries, source)
+        print(f'[LETTERBOXD] Imported {inserted} of {found} {source} entries for {inter.user} in {inter.guild.name}')
+
+        message = f'Imported **{inserted}** new diary entries'
+        if found > inserted:
+            message += f' ({found - inserted} were already recorded)'
+        message += '.'
+        if source == 'rss':
+            message += ' Your RSS feed only reaches back 50 entries; upload `diary.csv` from a Letterboxd export for your full history.'
+        await inter.followup.send(message, ephemeral=True)
+
+    @letterboxd_group.command(name='stats', description='Show Letterboxd leaderboards for this server')
+    async def letterboxd_stats(self, inter: discord.Interaction) -> None:
+        if not inter.guild:
+            await inter.response.send_message(
+                'This command can only be used in a server.', ephemeral=True
+            )
+            return
+
+        await inter.response.defer()
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        monthly = await self._top_monthly_loggers(inter.guild.id, now.strftime('%Y-%m'))
+        ratings = await self._top_average_ratings(inter.guild.id)
+        films = await self._most_watched_films(inter.guild.id)
+
+        if not (monthly or ratings or films):
+            await inter.followup.send(
+                'No diary entries recorded yet. New entries are picked up as they\'re posted, '
+                'or members can use `/letterboxd import` to bring in their history.'
+            )
+            return
+
+        members = await self.bot.get_or_query_members(
+            inter.guild, list({row['user_id'] for row in (*monthly, *ratings)})
+        )
+
+        def name(user_id: int) -> str:
+            member = members.get(user_id)
+            return member.display_name if member else 'Former member'
+
+        embed = discord.Embed(title='Letterboxd Leaderboards', color=LETTERBOXD_COLOR)
+        embed.add_field(
+            name=f'Most films logged in {calendar.month_name[now.month]}',
+            value='\n'.join(
+                f'{rank}. {name(row["user_id"])} -- {row["films"]} films'
+                for rank, row in enumerate(monthly, 1)
+            ) or 'Nothing logged yet this month.',
+            inline=False,
+        )
+        embed.add_field(
+            name='Highest average rating',
+            value='\n'.join(
+                f'{rank}. {name(row["user_id"])} -- {row["average"]:.2f}{STAR_FULL} over {row["rated"]} ratings'
+                for rank, row in enumerate(ratings, 1)
+            ) or f'No one has rated {STATS_MIN_RATED} films yet.',
+            inline=False,
+        )
+        embed.add_field(
+            name='Most watched in this server',
+            value='\n'.join(
+                f'{rank}. {row["film_title"]} ({row["film_year"] or "????"}) -- {row["watches"]} watches'
+                for rank, row in enumerate(films, 1)
+            ),
+            inline=False,
+        )
+        embed.set_footer(text='Imp Bot 10000')
+
+        await inter.followup.send(embed=embed)
+
     @letterboxd_group.command(name='list', description='Show all followed Letterboxd users in this server')
     async def letterboxd_list(self, inter: discord.Interaction) -> None:
         if not inter.guild:
@@ -426,9 +1201,13 @@ class LetterboxdCog(commands.Cog):
             )
             return
 
+        # Looking up uncached members can take a moment in the slim intent profile
+        await inter.response.defer(ephemeral=True)
+        members = await self.bot.get_or_query_members(inter.guild, [row['user_id'] for row in rows])
+
         lines = []
         for row in rows:
-            member = inter.guild.get_member(row['user_id'])
+            member = members.get(row['user_id'])
             if not member:
                 continue
             lb_user = row['letterboxd_username']
@@ -437,7 +1216,7 @@ class LetterboxdCog(commands.Cog):
             )
 
         if not lines:
-            await inter.response.send_message(
+            await inter.followup.send(
                 'No linked Letterboxd profiles found for current server members.',
                 ephemeral=True,
             )
@@ -450,7 +1229,7 @@ class LetterboxdCog(commands.Cog):
         )
         embed.set_footer(text='Imp Bot 10000')
 
-        await inter.response.send_message(embed=embed, ephemeral=True)
+        await inter.followup.send(embed=embed, ephemeral=True)
 
 
 async def setup(bot: commands.Bot) -> None:
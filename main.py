@@ -1,3 +1,8 @@
+import time
+STARTUP_BEGAN = time.perf_counter()  # taken before the heavier imports so they count towards startup
+
+import asyncio
+import collections
 import datetime
 import json
 import logging
@@ -5,8 +10,21 @@ import os
 
 import aiohttp
 import discord
+from discord import app_commands
 from discord.ext import commands
 from dotenv import load_dotenv
+from typing import Callable, Optional
+
+from database import Database
+from dispatcher import MessageDispatcher
+from imagecache import ImageCache
+
+try:
+    import resource
+except ImportError:  # not available on Windows, where peak RSS is simply left out
+    resource = None
+
+IMPORTS_FINISHED = time.perf_counter()
 
 # loading API tokens as environment variables
 load_dotenv()
@@ -14,6 +32,13 @@ DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 TWITCH_ACCESS_TOKEN = os.getenv("TWITCH_ACCESS_TOKEN")
 TWITCH_CLIENT_ID = os.getenv("TWITCH_CLIENT_ID")
 TWITCH_CLIENT_SECRET = os.getenv("TWITCH_CLIENT_SECRET")
+# Set to a directory to upload embed images from a local cache instead of hot-linking them
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR")
+
+# Sharding: set SHARD_COUNT (and optionally SHARD_IDS="0,1") or IMPBOT_SHARDED=1 to let Discord pick the count
+SHARD_COUNT = os.getenv("SHARD_COUNT")
+SHARD_IDS = os.getenv("SHARD_IDS")
+SHARDED = os.getenv("IMPBOT_SHARDED", "").lower() in ("1", "true", "yes") or bool(SHARD_COUNT)
 
 #logging.basicConfig(level=logging.INFO)
 handler = logging.FileHandler(
@@ -25,14 +50,187 @@ handler = logging.FileHandler(
 if not DISCORD_TOKEN:
     raise RuntimeError("DISCORD_TOKEN is missing from the environment. Check your .env file.")
 
+# "full" keeps presences and chunks every guild at startup. "slim" drops presence updates (the busiest
+# gateway event), caches only voice members and ones it has looked up, and resolves others on demand.
+INTENT_PROFILE = os.getenv("IMPBOT_INTENT_PROFILE", "full").lower()
+GATEWAY_STATS = os.getenv("IMPBOT_GATEWAY_STATS", "").lower() in ("1", "true", "yes")
+
 intents = discord.Intents.default()
 intents.members = True
 intents.message_content = True
-intents.presences = True
+intents.presences = INTENT_PROFILE != "slim"
+
+# Cogs named in IMPBOT_LAZY_COGS (e.g. "lpc,starboard") aren't imported until one of their slash commands
+# or listeners first fires.
+LAZY_COGS = [cog.strip() for cog in os.getenv("IMPBOT_LAZY_COGS", "").split(",") if cog.strip()]
+
+# The starboard's emoji, repeated here so checking a reaction doesn't mean importing the cog
+STARBOARD_EMOJI = "⭐"
+
+
+def _is_star_reaction(payload) -> bool:
+    return str(payload.emoji) == STARBOARD_EMOJI
+
+
+def _is_starboard_post(dedup_key, *_) -> bool:
+    return bool(dedup_key) and dedup_key.startswith('starboard:')
+
+
+# What wakes each cog that can be loaded lazily: (top-level slash commands, {gateway event: filter}). An event
+# only loads the cog if its filter accepts the event's arguments, or the filter is None. Cogs that start
+# background loops in cog_load (events, birthdays, letterboxd) are left out, since their loops would sit idle
+# until someone happened to use one of their commands.
+LAZY_COG_TRIGGERS: dict[str, tuple[tuple[str, ...], dict[str, Optional[Callable[..., bool]]]]] = {
+    'lpc': (('play',), {}),
+    'starboard': (
+        ('starboard',),
+        {
+            'raw_reaction_add': _is_star_reaction,
+            'raw_reaction_remove': _is_star_reaction,
+            'raw_reaction_clear': None,
+            'raw_reaction_clear_emoji': _is_star_reaction,
+            'outbound_message_sent': _is_starboard_post,
+        },
+    ),
+}
+# How long the first use of a lazy command waits for its cog, within Discord's 3 second deadline
+LAZY_LOAD_WAIT_SECONDS = 2.0
+
+# Members that weren't found (usually because they left) aren't asked for again for this long
+MISSING_MEMBER_SECONDS = 6 * 3600
+
+HTTP_CONNECTION_LIMIT = 100
+HTTP_CONNECTIONS_PER_HOST = 10
+HTTP_DNS_CACHE_SECONDS = 300
+HTTP_KEEPALIVE_SECONDS = 60
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
 
 
-class ImpBot(commands.Bot):
+class LazyCommandTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction, /) -> bool:
+        # Runs before the command lookup, so a lazy cog's commands exist by the time the tree looks for them
+        if interaction.type not in (discord.InteractionType.application_command, discord.InteractionType.autocomplete):
+            return True
+        extension = self.client.lazy_commands.get(interaction.data.get('name'))
+        if not extension:
+            return True
+
+        # Loading normally takes milliseconds, so the command just runs once it's done. A load that would outlast
+        # the 3 second deadline for answering carries on in the background and the user is asked to retry.
+        started = time.monotonic()
+        task = self.client.start_extension_load(extension)
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout=LAZY_LOAD_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        # The import itself blocks the loop, so check the clock too rather than trusting the timeout alone
+        if task.done() and time.monotonic() - started < LAZY_LOAD_WAIT_SECONDS:
+            return True
+
+        if interaction.type == discord.InteractionType.application_command:
+            try:
+                await interaction.response.send_message(
+                    '> That command is waking up, try it again in a moment. :hourglass:', ephemeral=True
+                )
+            except discord.HTTPException:
+                pass
+        return False
+
+
+class ImpBot(commands.AutoShardedBot if SHARDED else commands.Bot):
+    http_session: aiohttp.ClientSession
+    db: Database
+    dispatcher: MessageDispatcher
+    image_cache: Optional[ImageCache] = None
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.gateway_events: collections.Counter[str] = collections.Counter()
+        self.gateway_stats_since = time.monotonic()
+        self.startup_timings: dict[str, float] = {'imports': IMPORTS_FINISHED - STARTUP_BEGAN}
+        self.startup_reported = False
+        self._login_started = STARTUP_BEGAN
+        self._twitch_check_task: Optional[asyncio.Task] = None
+        self.lazy_commands: dict[str, str] = {}
+        self._lazy_listeners: dict[str, list[tuple[str, Callable]]] = {}
+        self._lazy_loads: dict[str, asyncio.Task] = {}
+        self._missing_members: dict[tuple[int, int], float] = {}
+
+    async def get_or_query_members(self, guild: discord.Guild, user_ids: list[int]) -> dict[int, discord.Member]:
+        """Resolves members from the cache, asking the gateway for any that aren't cached yet."""
+        now = time.monotonic()
+        members = {}
+        missing = []
+        for user_id in user_ids:
+            member = guild.get_member(user_id)
+            if member:
+                members[user_id] = member
+            elif self._missing_members.get((guild.id, user_id), 0) <= now:
+                missing.append(user_id)
+
+        if missing and self._missing_members:
+            # Expired entries are dropped before new ones go in, so the map only holds the current window
+            self._missing_members = {key: until for key, until in self._missing_members.items() if until > now}
+
+        # Members who left miss the cache in either profile, so remember who wasn't found
+        for start in range(0, len(missing), 100):
+            batch = missing[start:start + 100]
+            try:
+                queried = await guild.query_members(user_ids=batch, cache=True)
+            except (asyncio.TimeoutError, discord.ClientException) as e:
+                print(f'Member lookup failed in {guild.name} [{guild.id}]: {e}')
+                continue
+            members.update((member.id, member) for member in queried)
+            for user_id in batch:
+                if user_id not in members:
+                    self._missing_members[(guild.id, user_id)] = now + MISSING_MEMBER_SECONDS
+        return members
+
+    async def on_member_join(self, member: discord.Member) -> None:
+        self._missing_members.pop((member.guild.id, member.id), None)
+
     async def setup_hook(self) -> None:
+        setup_started = time.perf_counter()
+
+        # One pooled session for every cog, so TCP/TLS connections are reused between calls
+        self.http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=HTTP_CONNECTION_LIMIT,
+                limit_per_host=HTTP_CONNECTIONS_PER_HOST,
+                ttl_dns_cache=HTTP_DNS_CACHE_SECONDS,
+                keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+            )
+        )
+
+        # Token validation only prints a warning, so it shouldn't hold up the login
+        self._twitch_check_task = asyncio.create_task(self._validate_twitch_token())
+
+        # One database connection for every cog; writes are serialized and batched
+        phase_started = time.perf_counter()
+        self.db = Database()
+        await self.db.connect()
+        self.startup_timings['database connect'] = time.perf_counter() - phase_started
+
+        # Every cog's outbound posts go through one durable, rate-aware queue
+        phase_started = time.perf_counter()
+        self.dispatcher = MessageDispatcher(self, self.db)
+        await self.dispatcher.start()
+        self.startup_timings['dispatcher'] = time.perf_counter() - phase_started
+
+        if IMAGE_CACHE_DIR:
+            self.image_cache = ImageCache(self.http_session, self.db, IMAGE_CACHE_DIR)
+            try:
+                await self.image_cache.start()
+            except OSError as e:
+                print(f'[IMAGECACHE] Cache directory {IMAGE_CACHE_DIR} is unusable, hot-linking images instead: {e}')
+                self.image_cache = None
+
         cogs_list = [
             'slash',
             'events',
@@ -42,52 +240,195 @@ class ImpBot(commands.Bot):
             'lpc'
         ]
 
-        for cog in cogs_list:
-            try:
-                await self.load_extension(cog)
-                print(f'{cog} successfully loaded!')
-            except Exception as e:
-                print(f'{cog} loading failed: {e}')
-
-        if TWITCH_ACCESS_TOKEN:
-            twitch_headers = {'Authorization': f'Bearer {TWITCH_ACCESS_TOKEN}'}
-            async with aiohttp.ClientSession(headers=twitch_headers) as session:
-                try:
-                    async with session.get('https://id.twitch.tv/oauth2/validate') as response:
-                        match response.status:
-                            case 200:
-                                validation_response = await response.json()
-                                expires_in = validation_response['expires_in']
-                                delta = datetime.timedelta(seconds=expires_in)
-                                if expires_in >= datetime.timedelta(weeks=1).total_seconds():
-                                    print(f'~~~{delta.days} days until Twitch token expires!~~~')
-                                else:
-                                    hours = int(delta.total_seconds() // 3600)
-                                    print(f'!!! RENEW YOUR TOKEN !!!\n{hours} hours until Twitch token expires.\n!!! RENEW YOUR TOKEN !!!')
-                            case 401:
-                                error_body = await response.json()
-                                print(f'Twitch access token invalid. Verify token validity or expiration.\n{response.status} response!\n{response.headers}\n{error_body}')
-                            case _:
-                                print(f'Unexpected Twitch validation response: {response.status}')
-                except aiohttp.ClientConnectorError as e:
-                    print(f'Twitch validation connection error: {e}')
-        else:
+        for cog in LAZY_COGS:
+            if cog in LAZY_COG_TRIGGERS:
+                self._register_lazy_cog(cog)
+            else:
+                print(f'{cog} can\'t be loaded lazily, loading it at startup')
+
+        # Cogs only share the session, database and dispatcher set up above, so they can load side by side
+        phase_started = time.perf_counter()
+        await asyncio.gather(*(self._load_cog(cog) for cog in cogs_list if cog not in self._lazy_listeners))
+        self.startup_timings['cogs (wall clock)'] = time.perf_counter() - phase_started
+        self.startup_timings['table creation (summed)'] = self.db.schema_seconds
+        self.startup_timings['setup_hook'] = time.perf_counter() - setup_started
+        self._login_started = time.perf_counter()
+
+    async def _load_cog(self, cog: str) -> bool:
+        started = time.perf_counter()
+        try:
+            await self.load_extension(cog)
+            print(f'{cog} successfully loaded!')
+            return True
+        except Exception as e:
+            print(f'{cog} loading failed: {e}')
+            return False
+        finally:
+            self.startup_timings[f'cog {cog}'] = time.perf_counter() - started
+
+    def _register_lazy_cog(self, extension: str) -> None:
+        command_names, events = LAZY_COG_TRIGGERS[extension]
+        for name in command_names:
+            self.lazy_commands[name] = extension
+        stubs = []
+        for event, wanted in events.items():
+            stub = self._lazy_listener(extension, event, wanted)
+            self.add_listener(stub, f'on_{event}')
+            stubs.append((f'on_{event}', stub))
+        self._lazy_listeners[extension] = stubs
+        print(f'{extension} will load on first use')
+
+    def _lazy_listener(self, extension: str, event: str, wanted: Optional[Callable[..., bool]]) -> Callable:
+        async def stub(*args) -> None:
+            # Events the cog would ignore anyway (other emoji, other cogs' posts) leave it unloaded
+            if wanted and not wanted(*args):
+                return
+            if not await self.ensure_extension(extension):
+                return
+            # The cog missed the event that woke it, so hand it over directly
+            for cog in self.cogs.values():
+                if type(cog).__module__ != extension:
+                    continue
+                for name, listener in cog.get_listeners():
+                    if name == f'on_{event}':
+                        await listener(*args)
+        return stub
+
+    async def ensure_extension(self, extension: str) -> bool:
+        """Loads a lazy cog if it isn't loaded yet. Concurrent callers share one load."""
+        if extension in self.extensions:
+            return True
+        return await asyncio.shield(self.start_extension_load(extension))
+
+    def start_extension_load(self, extension: str) -> asyncio.Task:
+        task = self._lazy_loads.get(extension)
+        if task is None:
+            task = self._lazy_loads[extension] = asyncio.create_task(self._load_lazy_cog(extension))
+        return task
+
+    async def _load_lazy_cog(self, extension: str) -> bool:
+        started = time.perf_counter()
+        loaded = await self._load_cog(extension)
+        # Whether or not it loaded, stop waking it up on every event
+        for name, stub in self._lazy_listeners.pop(extension, []):
+            self.remove_listener(stub, name)
+        for command_name in [name for name, owner in self.lazy_commands.items() if owner == extension]:
+            del self.lazy_commands[command_name]
+        print(f'{extension} loaded on demand in {(time.perf_counter() - started) * 1000:.0f}ms')
+        return loaded
+
+    async def _validate_twitch_token(self) -> None:
+        if not TWITCH_ACCESS_TOKEN:
             print('TWITCH_ACCESS_TOKEN not set, skipping validation.')
+            return
+
+        twitch_headers = {'Authorization': f'Bearer {TWITCH_ACCESS_TOKEN}'}
+        try:
+            async with self.http_session.get('https://id.twitch.tv/oauth2/validate', headers=twitch_headers) as response:
+                match response.status:
+                    case 200:
+                        validation_response = await response.json()
+                        expires_in = validation_response['expires_in']
+                        delta = datetime.timedelta(seconds=expires_in)
+                        if expires_in >= datetime.timedelta(weeks=1).total_seconds():
+                            print(f'~~~{delta.days} days until Twitch token expires!~~~')
+                        else:
+                            hours = int(delta.total_seconds() // 3600)
+                            print(f'!!! RENEW YOUR TOKEN !!!\n{hours} hours until Twitch token expires.\n!!! RENEW YOUR TOKEN !!!')
+                    case 401:
+                        error_body = await response.json()
+                        print(f'Twitch access token invalid. Verify token validity or expiration.\n{response.status} response!\n{response.headers}\n{error_body}')
+                    case _:
+                        print(f'Unexpected Twitch validation response: {response.status}')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # Nothing awaits this background task, so anything left uncaught here would vanish unreported
+            print(f'Twitch validation failed: {e!r}')
+
+    def startup_report(self) -> list[str]:
+        """Per-phase startup timings. Cogs load concurrently, so their times overlap."""
+        self.startup_timings['gateway READY'] = time.perf_counter() - self._login_started
+        lines = [f'{phase}: {seconds * 1000:.0f}ms' for phase, seconds in self.startup_timings.items()]
+        lines.append(f'total: {(time.perf_counter() - STARTUP_BEGAN) * 1000:.0f}ms')
+        rss = peak_rss_mb()
+        if rss is not None:
+            lines.append(f'peak RSS: {rss:.1f} MB')
+        if self._lazy_listeners:
+            lines.append(f'lazy cogs not loaded yet: {", ".join(self._lazy_listeners)}')
+        return lines
+
+    def shard_report(self) -> list[str]:
+        guild_counts = collections.Counter(guild.shard_id for guild in self.guilds)
+        if isinstance(self, commands.AutoShardedBot):
+            latencies = self.latencies
+        else:
+            latencies = [(0, self.latency)]
+        return [
+            f'Shard {shard_id}: {latency * 1000:.0f}ms latency, {guild_counts[shard_id]} guilds'
+            for shard_id, latency in latencies
+        ]
 
+    async def close(self) -> None:
+        await super().close()
+        if self._twitch_check_task:
+            self._twitch_check_task.cancel()
+        if getattr(self, 'http_session', None):
+            await self.http_session.close()
+        if getattr(self, 'dispatcher', None):
+            await self.dispatcher.close()
+        if getattr(self, 'db', None):
+            await self.db.close()
+
+
+profile_options = {}
+if INTENT_PROFILE == "slim":
+    # Voice members only (the music player needs them); everyone else is cached when looked up
+    profile_options['member_cache_flags'] = discord.MemberCacheFlags.none()
+    profile_options['member_cache_flags'].voice = True
+    profile_options['chunk_guilds_at_startup'] = False
+if GATEWAY_STATS:
+    profile_options['enable_debug_events'] = True
+
+shard_options = {}
+if SHARDED:
+    if SHARD_COUNT:
+        shard_options['shard_count'] = int(SHARD_COUNT)
+    if SHARD_IDS:
+        shard_options['shard_ids'] = [int(shard_id) for shard_id in SHARD_IDS.split(',')]
 
 bot = ImpBot(
     command_prefix='!',
     description='IMP BOT 9000 COMMAND INDEX',
-    intents=intents
+    intents=intents,
+    tree_cls=LazyCommandTree,
+    **profile_options,
+    **shard_options
     )
 
 ##############################################################################
 ############################## EVENTS SECTION ################################
 ##############################################################################
 
+@bot.event
+async def on_socket_event_type(event_type: str):
+    # Only dispatched when IMPBOT_GATEWAY_STATS enables discord.py's debug events
+    bot.gateway_events[event_type] += 1
+
+@bot.event
+async def on_shard_ready(shard_id: int):
+    shard_guilds = sum(1 for guild in bot.guilds if guild.shard_id == shard_id)
+    print(f'Shard {shard_id} ready with {shard_guilds} guilds')
+
 @bot.event
 async def on_ready():
     print('CBot is logged in as {0.user}'.format(bot))
+    for line in bot.shard_report():
+        print(line)
+    # on_ready fires again after every reconnect; the startup breakdown is only meaningful once
+    if not bot.startup_reported:
+        bot.startup_reported = True
+        print('Startup timings:')
+        for line in bot.startup_report():
+            print(f'  {line}')
     await bot.change_presence(activity=discord.Game(f"Danny Simulator {datetime.date.today().year+1}"))
 
 ##############################################################################
@@ -98,12 +439,14 @@ async def on_ready():
 @commands.is_owner()
 async def sync(ctx: commands.Context) -> None:
     """Syncs commands globally"""
+    # Lazy cogs' commands aren't in the tree until loaded, and syncing without them would unregister them
+    await asyncio.gather(*(ctx.bot.ensure_extension(cog) for cog in LAZY_COGS if cog in LAZY_COG_TRIGGERS))
     synced = await ctx.bot.tree.sync()
     await ctx.send(f'Synced {len(synced)} commands globally')
 
 @bot.command()
 @commands.is_owner()
-async def refresh_twitch(_ctx: commands.Context) -> None:
+async def refresh_twitch(ctx: commands.Context) -> None:
     """Refreshes your Twitch API token"""
     twitch_headers = {'Content-Type': 'application/x-www-form-urlencoded'}
     params = {
@@ -111,16 +454,50 @@ async def refresh_twitch(_ctx: commands.Context) -> None:
         'client_secret': f'{TWITCH_CLIENT_SECRET}',
         'grant_type': 'client_credentials'
         }
-    async with aiohttp.ClientSession(headers=twitch_headers) as session:
-        async with session.post('https://id.twitch.tv/oauth2/token', params=params) as response:
-            refresh_response = await response.json()
-
-            if response.status == 400:
-                print(f'Token refresh failed: {refresh_response["message"]}')
-            elif response.status == 200:
-                print(json.dumps(refresh_response, indent=2))
-            else:
-                print(refresh_response)
+    async with ctx.bot.http_session.post(
+        'https://id.twitch.tv/oauth2/token', headers=twitch_headers, params=params
+    ) as response:
+        refresh_response = await response.json()
+
+        if response.status == 400:
+            print(f'Token refresh failed: {refresh_response["message"]}')
+        elif response.status == 200:
+            print(json.dumps(refresh_response, indent=2))
+        else:
+            print(refresh_response)
+
+@bot.command()
+@commands.is_owner()
+async def gatewaystats(ctx: commands.Context) -> None:
+    """Reports gateway event rates and memory use for comparing intent profiles"""
+    elapsed = time.monotonic() - bot.gateway_stats_since
+    total = sum(bot.gateway_events.values())
+    cached_members = sum(len(guild.members) for guild in bot.guilds)
+    rss = peak_rss_mb()
+    lines = [
+        f'Profile: {INTENT_PROFILE} (presences {"on" if bot.intents.presences else "off"})',
+        f'Peak RSS: {f"{rss:.1f} MB" if rss is not None else "n/a"}, cached members: {cached_members}, users: {len(bot.users)}',
+    ]
+    if GATEWAY_STATS:
+        lines.append(f'Gateway events: {total} in {elapsed:.0f}s ({total / max(elapsed, 1):.2f}/s)')
+        lines.extend(f'  {event_type}: {count}' for event_type, count in bot.gateway_events.most_common(5))
+    else:
+        lines.append('Set IMPBOT_GATEWAY_STATS=1 to count gateway events.')
+    await ctx.send('```\n' + '\n'.join(lines) + '\n```')
+
+@bot.command()
+@commands.is_owner()
+async def imagecache(ctx: commands.Context) -> None:
+    """Reports how well the embed image cache is doing"""
+    cache = bot.image_cache
+    if not cache:
+        await ctx.send('The image cache is off. Set IMAGE_CACHE_DIR to enable it.')
+        return
+    await ctx.send(
+        f'Image cache: {cache.hits} hits, {cache.misses} misses ({cache.hit_rate:.0%} hit rate), '
+        f'{cache.bytes_saved / 1024 / 1024:.1f} MB of downloads and resizing saved, '
+        f'{cache.total_bytes / 1024 / 1024:.1f} of {cache.max_bytes / 1024 / 1024:.0f} MB used'
+    )
 
 @bot.command(description='Returns some basic stats about the user.')
 async def whois(ctx: commands.Context, *, member: discord.Member):
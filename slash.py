@@ -1,7 +1,6 @@
 import os
 import discord
 import random
-import aiohttp
 import asyncio
 from discord import app_commands
 from discord.ext import commands
@@ -32,14 +31,13 @@ class SlashCommands(commands.Cog):
     @app_commands.command(name='refresh-twitch-token', description='Refreshes the Twitch API token')
     @app_commands.check(is_owner)
     async def refresh_twitch_token(self, inter: discord.Interaction) -> None:
-        async with aiohttp.ClientSession(headers=twitch_refresh_header) as session:
-            params = {
-                'grant_type': 'refresh_token',
-                'refresh_token': f'{TWITCH_ACCESS_TOKEN}',
-                'client_id': f'{TWITCH_CLIENT_ID}',
-                'client_secret': f'{TWITCH_SECRET}'
-            }
-            pass
+        params = {
+            'grant_type': 'refresh_token',
+            'refresh_token': f'{TWITCH_ACCESS_TOKEN}',
+            'client_id': f'{TWITCH_CLIENT_ID}',
+            'client_secret': f'{TWITCH_SECRET}'
+        }
+        pass
 
     @app_commands.command(name='roll', description='Rolls a d20')
     async def roll(self, inter: discord.Interaction) -> None:
@@ -70,6 +68,9 @@ class SlashCommands(commands.Cog):
     @app_commands.command(name='game', description='Name and shame a game a user is playing')
     @app_commands.describe(member="The user whose playing status to show")
     async def game(self, inter: discord.Interaction, member: discord.Member) -> None:
+        if not inter.client.intents.presences:
+            await inter.response.send_message('> Presence tracking is turned off for this bot, so I can\'t see what anyone is playing.', ephemeral=True)
+            return
         if member.activity is not None:
             embed = discord.Embed(
                 title='Get A Load Of This Guy!',
@@ -97,37 +98,36 @@ class SlashCommands(commands.Cog):
                     url=f'https://en.wikipedia.org/wiki/{str(article_name).replace(' ','_')}'
                     ))
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get('https://en.wikipedia.org/w/api.php?action=query&format=json&prop=images%7Cdescription%7Cextracts%7Cimageinfo&meta=&generator=random&formatversion=2&imlimit=1&exlimit=1&exintro=1&explaintext=1&exsectionformat=plain&iiprop=url&iiurlwidth=440&iiurlheight=248&grnnamespace=0&grnfilterredir=nonredirects&grnlimit=1') as wiki_response:
-                match wiki_response.status:
-                    case 200:
-                        random_article = await wiki_response.json()
-                        article_name = random_article['query']['pages'][0]['title']
-                        article_body = random_article['query']['pages'][0]['extract']
-
-                        embed = discord.Embed(
-                            title=article_name,
-                            url=f'https://en.wikipedia.org/wiki/{str(article_name).replace(' ','_')}',
-                            description=article_body[:500]+'...',
-                            color=discord.Colour.lighter_grey()
-                            )
-                        embed.set_author(
-                            name='Wikipedia',
-                            url=f'https://en.wikipedia.org/wiki/{str(article_name).replace(' ','_')}',
-                            icon_url='https://upload.wikimedia.org/wikipedia/commons/9/9f/Old_wikipedia_logo.png'
-                            )
-                        if random_article['query']['pages'][0]['images'][0]['title']:
-                            image_name = random_article['query']['pages'][0]['images'][0]['title']
-                            embed.set_image(url=f'https://commons.wikimedia.org/wiki/Special:FilePath/{str(image_name).replace(' ','_')}')
-                        else:
-                            return
-
-                        await inter.response.send_message(embed=embed,view=WikiLinkButton())
+        async with self.bot.http_session.get('https://en.wikipedia.org/w/api.php?action=query&format=json&prop=images%7Cdescription%7Cextracts%7Cimageinfo&meta=&generator=random&formatversion=2&imlimit=1&exlimit=1&exintro=1&explaintext=1&exsectionformat=plain&iiprop=url&iiurlwidth=440&iiurlheight=248&grnnamespace=0&grnfilterredir=nonredirects&grnlimit=1') as wiki_response:
+            match wiki_response.status:
+                case 200:
+                    random_article = await wiki_response.json()
+                    article_name = random_article['query']['pages'][0]['title']
+                    article_body = random_article['query']['pages'][0]['extract']
+
+                    embed = discord.Embed(
+                        title=article_name,
+                        url=f'https://en.wikipedia.org/wiki/{str(article_name).replace(' ','_')}',
+                        description=article_body[:500]+'...',
+                        color=discord.Colour.lighter_grey()
+                        )
+                    embed.set_author(
+                        name='Wikipedia',
+                        url=f'https://en.wikipedia.org/wiki/{str(article_name).replace(' ','_')}',
+                        icon_url='https://upload.wikimedia.org/wikipedia/commons/9/9f/Old_wikipedia_logo.png'
+                        )
+                    if random_article['query']['pages'][0]['images'][0]['title']:
+                        image_name = random_article['query']['pages'][0]['images'][0]['title']
+                        embed.set_image(url=f'https://commons.wikimedia.org/wiki/Special:FilePath/{str(image_name).replace(' ','_')}')
+                    else:
                         return
-                    case _:
-                        print(f"[ERROR] {wiki_response.url} returned a {wiki_response.status} response")
-                        return
-    
+
+                    await inter.response.send_message(embed=embed,view=WikiLinkButton())
+                    return
+                case _:
+                    print(f"[ERROR] {wiki_response.url} returned a {wiki_response.status} response")
+                    return
+
     # @wiki_group.command(name='search',description='Searchs Wikipedia',)
     # async def wiki_search(self, inter:discord.Interaction) -> None:
 
@@ -168,39 +168,39 @@ class SlashCommands(commands.Cog):
     @app_commands.guilds(discord.Object(287104624865837067)) # ImpZone guild ID
     async def bobstream(self,inter: discord.Interaction) -> None:
         username = 'bn03'
-        async with aiohttp.ClientSession(headers=twitch_headers) as session:
-            async with session.get(f'https://api.twitch.tv/helix/streams?user_login={username}') as stream_info_response:
-                twitch_stream_info = await stream_info_response.json()
-                #thumbnail_url = twitch_user_info['data'][0]['profile_image_url']
-            async with session.get(f'https://api.twitch.tv/helix/users?login={username}') as user_info_response:
-                twitch_user_info = await user_info_response.json()
-            
-            try:
-                embed = discord.Embed(
-                    title=f'{twitch_stream_info['data'][0]['title']}',
-                    url=f'https://www.twitch.tv/{username}',
-                    description=f'Now streaming {twitch_stream_info['data'][0]['game_name']}',
-                    color=discord.Color.pink()
-                )
-                embed.set_author(
-                    name=f'Bob is now live on Twitch!',
-                    url=f'https://www.twitch.tv/{username}'
-                    #icon_url=f'{after.activity.assets}'
-                )
-                embed.set_image(
-                    url=f'https://static-cdn.jtvnw.net/previews-ttv/live_user_{username}-400x250.jpg'
-                )
-                embed.set_thumbnail(
-                    url=twitch_user_info['data'][0]['profile_image_url']
-                )
-                embed.set_footer(
-                    text='CBot 9000'
-                )
-                await inter.response.send_message(content='Bob is now streaming live!',embed=embed)
-                return
-            except IndexError:
-                await inter.response.send_message('> Bob\'s stream is offline! :sob:')
-                return
+        session = self.bot.http_session
+        async with session.get(f'https://api.twitch.tv/helix/streams?user_login={username}', headers=twitch_headers) as stream_info_response:
+            twitch_stream_info = await stream_info_response.json()
+            #thumbnail_url = twitch_user_info['data'][0]['profile_image_url']
+        async with session.get(f'https://api.twitch.tv/helix/users?login={username}', headers=twitch_headers) as user_info_response:
+            twitch_user_info = await user_info_response.json()
+
+        try:
+            embed = discord.Embed(
+                title=f'{twitch_stream_info['data'][0]['title']}',
+                url=f'https://www.twitch.tv/{username}',
+                description=f'Now streaming {twitch_stream_info['data'][0]['game_name']}',
+                color=discord.Color.pink()
+            )
+            embed.set_author(
+                name=f'Bob is now live on Twitch!',
+                url=f'https://www.twitch.tv/{username}'
+                #icon_url=f'{after.activity.assets}'
+            )
+            embed.set_image(
+                url=f'https://static-cdn.jtvnw.net/previews-ttv/live_user_{username}-400x250.jpg'
+            )
+            embed.set_thumbnail(
+                url=twitch_user_info['data'][0]['profile_image_url']
+            )
+            embed.set_footer(
+                text='CBot 9000'
+            )
+            await inter.response.send_message(content='Bob is now streaming live!',embed=embed)
+            return
+        except IndexError:
+            await inter.response.send_message('> Bob\'s stream is offline! :sob:')
+            return
 
 async def setup(bot: commands.Bot) -> None:
     await bot.add_cog(SlashCommands(bot))
\ No newline at end of file
@@ -1,55 +1,92 @@
+import asyncio
+import time
 import aiosqlite
 import discord
 from discord import app_commands
 from discord.ext import commands
+from collections import OrderedDict
 from typing import Optional
 
-DB_PATH = "impbot.db"
+from database import Database, GuildSettingsCache
+
 STAR_EMOJI = "⭐"
 DEFAULT_THRESHOLD = 3
 STARBOARD_COLOR = discord.Color.gold()
+STAR_DEBOUNCE_SECONDS = 2.0
+TALLY_CACHE_SIZE = 10000
+TALLY_RETENTION_SECONDS = 30 * 24 * 3600
+POST_CACHE_SIZE = 500
+MESSAGE_INDEX_SIZE = 1000  # matches discord.py's default message cache
 
 
 class StarboardCog(commands.Cog):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
-        self.db: Optional[aiosqlite.Connection] = None
+        self.db: Optional[Database] = None
+        self.configs: Optional[GuildSettingsCache] = None
+        # One worker per (guild_id, message_id); events arriving while it runs mark the key dirty
+        self._star_workers: dict[tuple[int, int], asyncio.Task] = {}
+        self._dirty_stars: set[tuple[int, int]] = set()
+        # Star counts maintained from raw reaction events. Only counts seen complete during this
+        # session are trusted; anything else is re-seeded from a single fetch_message.
+        self._tallies: OrderedDict[tuple[int, int], int] = OrderedDict()
+        self._stale_tallies: set[tuple[int, int]] = set()
+        self._session_started = time.time()
+        # Recently touched starboard posts: (guild_id, message_id) -> (post, star count it shows)
+        self._posts: OrderedDict[tuple[int, int], tuple[discord.PartialMessage, Optional[int]]] = OrderedDict()
+        # Posts handed to the dispatcher but not sent yet: key -> (source channel_id, star count queued)
+        self._pending_posts: dict[tuple[int, int], tuple[int, int]] = {}
+        # Recent messages from tracked channels by ID, so a reaction doesn't scan the whole message cache
+        self._recent_messages: OrderedDict[int, discord.Message] = OrderedDict()
+        # Starred messages edited since their post was last rendered
+        self._edited: set[tuple[int, int]] = set()
 
     starboard_group = app_commands.Group(name="starboard", description="Starboard commands")
 
     async def cog_load(self) -> None:
-        self.db = await aiosqlite.connect(DB_PATH)
-        self.db.row_factory = aiosqlite.Row
+        self.db = self.bot.db
         await self._create_tables()
+        self.configs = GuildSettingsCache(self.db, "starboard_config", ("channel_id", "threshold"))
+        await self.configs.load()
+        await self.db.write(
+            "DELETE FROM starboard_tallies WHERE updated_at < ?",
+            (time.time() - TALLY_RETENTION_SECONDS,)
+        )
 
     async def cog_unload(self) -> None:
-        if self.db:
-            await self.db.close()
+        for worker in self._star_workers.values():
+            worker.cancel()
 
     async def _create_tables(self) -> None:
-        await self.db.execute("""
-            CREATE TABLE IF NOT EXISTS starboard_config (
-                guild_id INTEGER PRIMARY KEY,
-                channel_id INTEGER NOT NULL,
-                threshold INTEGER NOT NULL DEFAULT 3
-            )
-        """)
-        await self.db.execute("""
-            CREATE TABLE IF NOT EXISTS starboard_entries (
-                guild_id INTEGER NOT NULL,
-                message_id INTEGER NOT NULL,
-                starboard_message_id INTEGER NOT NULL,
-                PRIMARY KEY (guild_id, message_id)
-            )
-        """)
-        await self.db.commit()
+        await self.db.create_tables(
+            """
+                CREATE TABLE IF NOT EXISTS starboard_config (
+                    guild_id INTEGER PRIMARY KEY,
+                    channel_id INTEGER NOT NULL,
+                    threshold INTEGER NOT NULL DEFAULT 3
+                )
+            """,
+            """
+                CREATE TABLE IF NOT EXISTS starboard_entries (
+                    guild_id INTEGER NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    starboard_message_id INTEGER NOT NULL,
+                    PRIMARY KEY (guild_id, message_id)
+                )
+            """,
+            """
+                CREATE TABLE IF NOT EXISTS starboard_tallies (
+                    guild_id INTEGER NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    star_count INTEGER NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (guild_id, message_id)
+                )
+            """,
+        )
 
-    async def _get_config(self, guild_id: int) -> Optional[aiosqlite.Row]:
-        async with self.db.execute(
-            "SELECT channel_id, threshold FROM starboard_config WHERE guild_id = ?",
-            (guild_id,)
-        ) as cursor:
-            return await cursor.fetchone()
+    def _get_config(self, guild_id: int) -> Optional[dict]:
+        return self.configs.get(guild_id)
 
     async def _get_entry(self, guild_id: int, message_id: int) -> Optional[aiosqlite.Row]:
         async with self.db.execute(
@@ -58,6 +95,93 @@ class StarboardCog(commands.Cog):
         ) as cursor:
             return await cursor.fetchone()
 
+    async def _get_post(
+        self, key: tuple[int, int], starboard_channel: discord.TextChannel
+    ) -> Optional[tuple[discord.PartialMessage, Optional[int]]]:
+        post = self._posts.get(key)
+        if post:
+            self._posts.move_to_end(key)
+            return post
+
+        entry = await self._get_entry(*key)
+        if not entry:
+            return None
+        # Edits and deletes only need the ID, so skip the fetch_message round-trip
+        post = (starboard_channel.get_partial_message(entry["starboard_message_id"]), None)
+        self._remember_post(key, *post)
+        return post
+
+    def _remember_post(self, key: tuple[int, int], post: discord.PartialMessage, star_count: Optional[int]) -> None:
+        self._posts[key] = (post, star_count)
+        self._posts.move_to_end(key)
+        while len(self._posts) > POST_CACHE_SIZE:
+            self._posts.popitem(last=False)
+
+    async def _get_tally(self, key: tuple[int, int]) -> Optional[int]:
+        """Returns a trusted star count for the message, or None if it has to be re-seeded."""
+        count = self._tallies.get(key)
+        if count is not None:
+            self._tallies.move_to_end(key)
+            return count
+
+        # Rows written before this session started may have missed reactions while we were offline
+        async with self.db.execute(
+            "SELECT star_count FROM starboard_tallies WHERE guild_id = ? AND message_id = ? AND updated_at >= ?",
+            (*key, self._session_started)
+        ) as cursor:
+            row = await cursor.fetchone()
+
+        # Another event may have seeded the tally while we were waiting on the read
+        count = self._tallies.get(key)
+        if count is None and row:
+            count = row["star_count"]
+            self._remember_tally(key, count)
+        return count
+
+    def _remember_tally(self, key: tuple[int, int], count: int) -> None:
+        self._tallies[key] = count
+        self._tallies.move_to_end(key)
+        while len(self._tallies) > TALLY_CACHE_SIZE:
+            self._tallies.popitem(last=False)
+
+    async def _set_tally(self, key: tuple[int, int], count: int) -> None:
+        self._remember_tally(key, count)
+        await self.db.write(
+            "INSERT OR REPLACE INTO starboard_tallies (guild_id, message_id, star_count, updated_at) VALUES (?, ?, ?, ?)",
+            (*key, count, time.time())
+        )
+
+    async def _adjust_tally(self, key: tuple[int, int], delta: int) -> None:
+        count = await self._get_tally(key)
+        if count is None:
+            # Unknown count: the update worker will seed it from the message itself
+            self._stale_tallies.add(key)
+            return
+        await self._set_tally(key, max(count + delta, 0))
+
+    async def _seed_tally(
+        self, key: tuple[int, int], source_channel: discord.abc.Messageable
+    ) -> Optional[tuple[discord.Message, int]]:
+        self._stale_tallies.discard(key)
+        try:
+            message = await source_channel.fetch_message(key[1])
+        except (discord.NotFound, discord.Forbidden, discord.HTTPException):
+            return None
+
+        star_reaction = next(
+            (r for r in message.reactions if str(r.emoji) == STAR_EMOJI),
+            None
+        )
+        star_count = star_reaction.count if star_reaction else 0
+
+        # Events that raced the fetch leave the count untrusted; the worker will run again for them
+        if key not in self._stale_tallies:
+            await self._set_tally(key, star_count)
+        return message, star_count
+
+    def _get_cached_message(self, message_id: int) -> Optional[discord.Message]:
+        return self._recent_messages.get(message_id)
+
     def _build_starboard_embed(self, message: discord.Message, star_count: int) -> discord.Embed:
         embed = discord.Embed(
             description=message.content or "",
@@ -79,7 +203,7 @@ class StarboardCog(commands.Cog):
         return embed
 
     async def _handle_star_update(self, guild_id: int, channel_id: int, message_id: int) -> None:
-        config = await self._get_config(guild_id)
+        config = self._get_config(guild_id)
         if not config:
             return
 
@@ -98,68 +222,194 @@ class StarboardCog(commands.Cog):
         if not source_channel:
             return
 
-        try:
-            message = await source_channel.fetch_message(message_id)
-        except (discord.NotFound, discord.Forbidden, discord.HTTPException):
-            return
-
-        star_reaction = next(
-            (r for r in message.reactions if str(r.emoji) == STAR_EMOJI),
-            None
-        )
-        star_count = star_reaction.count if star_reaction else 0
+        key = (guild_id, message_id)
+        message = self._get_cached_message(message_id)
+        star_count = await self._get_tally(key)
+        if star_count is None:
+            seeded = await self._seed_tally(key, source_channel)
+            if not seeded:
+                return
+            message, star_count = seeded
 
-        entry = await self._get_entry(guild_id, message_id)
+        post = await self._get_post(key, starboard_channel)
 
         if star_count >= config["threshold"]:
             star_label = f"{STAR_EMOJI} **{star_count}**"
-            embed = self._build_starboard_embed(message, star_count)
 
-            if entry:
+            if post:
+                sb_message, shown_count = post
+                if shown_count == star_count and key not in self._edited:
+                    return
                 try:
-                    sb_message = await starboard_channel.fetch_message(entry["starboard_message_id"])
-                    await sb_message.edit(content=star_label, embed=embed)
-                except (discord.NotFound, discord.HTTPException):
+                    if message:
+                        await sb_message.edit(content=star_label, embed=self._build_starboard_embed(message, star_count))
+                        self._edited.discard(key)
+                    else:
+                        # The existing embed is still accurate; only the count needs changing
+                        await sb_message.edit(content=star_label)
+                    self._remember_post(key, sb_message, star_count)
+                except discord.NotFound:
+                    self._posts.pop(key, None)
+                    self._edited.discard(key)
+                except discord.HTTPException:
                     pass
-            else:
-                try:
-                    sb_message = await starboard_channel.send(content=star_label, embed=embed)
-                    await self.db.execute(
-                        "INSERT INTO starboard_entries (guild_id, message_id, starboard_message_id) VALUES (?, ?, ?)",
-                        (guild_id, message_id, sb_message.id)
-                    )
-                    await self.db.commit()
-                except (discord.Forbidden, discord.HTTPException) as e:
-                    print(f"[STARBOARD] Failed to post message: {e}")
-        elif entry:
+            elif key not in self._pending_posts:
+                if not message:
+                    try:
+                        message = await source_channel.fetch_message(message_id)
+                    except (discord.NotFound, discord.Forbidden, discord.HTTPException):
+                        return
+                embed = self._build_starboard_embed(message, star_count)
+                self._pending_posts[key] = (channel_id, star_count)
+                # The entry is recorded in on_outbound_message_sent once the post has an ID
+                await self.bot.dispatcher.enqueue(
+                    starboard_channel,
+                    content=star_label,
+                    embed=embed,
+                    dedup_key=self._post_dedup_key(key),
+                )
+        elif key in self._pending_posts:
+            del self._pending_posts[key]
+            await self.bot.dispatcher.forget(self._post_dedup_key(key))
+        elif post:
+            self._posts.pop(key, None)
+            self._edited.discard(key)
             try:
-                sb_message = await starboard_channel.fetch_message(entry["starboard_message_id"])
-                await sb_message.delete()
+                await post[0].delete()
             except (discord.NotFound, discord.HTTPException):
                 pass
-            await self.db.execute(
+            await self.db.write(
                 "DELETE FROM starboard_entries WHERE guild_id = ? AND message_id = ?",
                 (guild_id, message_id)
             )
-            await self.db.commit()
+            # Let the message be posted again if it climbs back over the threshold
+            await self.bot.dispatcher.forget(self._post_dedup_key(key))
+
+    @staticmethod
+    def _post_dedup_key(key: tuple[int, int]) -> str:
+        return f"starboard:{key[0]}:{key[1]}"
+
+    @commands.Cog.listener()
+    async def on_outbound_message_sent(
+        self, dedup_key: Optional[str], message: discord.Message, queued_seconds: float
+    ) -> None:
+        if not dedup_key or not dedup_key.startswith("starboard:"):
+            return
+        _, guild_id, message_id = dedup_key.split(":")
+        key = (int(guild_id), int(message_id))
+        pending = self._pending_posts.pop(key, None)
+
+        # The message may have dropped below the threshold while its post was already being sent,
+        # too late for forget() to stop it
+        config = self._get_config(key[0])
+        star_count = await self._get_tally(key)
+        if not config or (star_count is not None and star_count < config["threshold"]):
+            try:
+                await message.delete()
+            except (discord.NotFound, discord.HTTPException):
+                pass
+            await self.bot.dispatcher.forget(dedup_key)
+            return
+
+        await self.db.write(
+            "INSERT OR REPLACE INTO starboard_entries (guild_id, message_id, starboard_message_id) VALUES (?, ?, ?)",
+            (*key, message.id)
+        )
+
+        self._remember_post(key, message.channel.get_partial_message(message.id), pending[1] if pending else None)
+        # Stars that arrived while the post sat in the queue still need to be reflected
+        if pending and self._tallies.get(key) != pending[1]:
+            self._schedule_star_update(key[0], pending[0], key[1])
+
+    def _schedule_star_update(self, guild_id: int, channel_id: int, message_id: int) -> None:
+        key = (guild_id, message_id)
+        if key in self._star_workers:
+            self._dirty_stars.add(key)
+            return
+        self._star_workers[key] = asyncio.create_task(self._star_update_worker(guild_id, channel_id, message_id))
+
+    async def _star_update_worker(self, guild_id: int, channel_id: int, message_id: int) -> None:
+        """Applies the first event right away, then coalesces any burst that follows into one update per window."""
+        key = (guild_id, message_id)
+        try:
+            while True:
+                self._dirty_stars.discard(key)
+                try:
+                    await self._handle_star_update(guild_id, channel_id, message_id)
+                except Exception as e:
+                    print(f"[STARBOARD] Update failed for message {message_id}: {e}")
+                await asyncio.sleep(STAR_DEBOUNCE_SECONDS)
+                if key not in self._dirty_stars:
+                    return
+        finally:
+            self._star_workers.pop(key, None)
+            self._dirty_stars.discard(key)
+
+    def _is_tracked(self, guild_id: Optional[int], channel_id: int) -> bool:
+        if not guild_id:
+            return False
+        config = self._get_config(guild_id)
+        return config is not None and channel_id != config["channel_id"]
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent) -> None:
-        if str(payload.emoji) != STAR_EMOJI or not payload.guild_id:
+        if str(payload.emoji) != STAR_EMOJI or not self._is_tracked(payload.guild_id, payload.channel_id):
             return
-        await self._handle_star_update(payload.guild_id, payload.channel_id, payload.message_id)
+        await self._adjust_tally((payload.guild_id, payload.message_id), 1)
+        self._schedule_star_update(payload.guild_id, payload.channel_id, payload.message_id)
 
     @commands.Cog.listener()
     async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent) -> None:
-        if str(payload.emoji) != STAR_EMOJI or not payload.guild_id:
+        if str(payload.emoji) != STAR_EMOJI or not self._is_tracked(payload.guild_id, payload.channel_id):
             return
-        await self._handle_star_update(payload.guild_id, payload.channel_id, payload.message_id)
+        await self._adjust_tally((payload.guild_id, payload.message_id), -1)
+        self._schedule_star_update(payload.guild_id, payload.channel_id, payload.message_id)
 
     @commands.Cog.listener()
     async def on_raw_reaction_clear(self, payload: discord.RawReactionClearEvent) -> None:
-        if not payload.guild_id:
+        if not self._is_tracked(payload.guild_id, payload.channel_id):
+            return
+        await self._set_tally((payload.guild_id, payload.message_id), 0)
+        self._schedule_star_update(payload.guild_id, payload.channel_id, payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_clear_emoji(self, payload: discord.RawReactionClearEmojiEvent) -> None:
+        if str(payload.emoji) != STAR_EMOJI or not self._is_tracked(payload.guild_id, payload.channel_id):
+            return
+        await self._set_tally((payload.guild_id, payload.message_id), 0)
+        self._schedule_star_update(payload.guild_id, payload.channel_id, payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message) -> None:
+        if not message.guild or not self._is_tracked(message.guild.id, message.channel.id):
+            return
+        self._index_message(message)
+
+    def _index_message(self, message: discord.Message) -> None:
+        self._recent_messages[message.id] = message
+        self._recent_messages.move_to_end(message.id)
+        while len(self._recent_messages) > MESSAGE_INDEX_SIZE:
+            self._recent_messages.popitem(last=False)
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent) -> None:
+        # The payload carries the whole edited message, so swap it in whether or not discord.py still has it
+        if payload.message_id in self._recent_messages:
+            self._recent_messages[payload.message_id] = payload.message
+
+        if not self._is_tracked(payload.guild_id, payload.channel_id):
             return
-        await self._handle_star_update(payload.guild_id, payload.channel_id, payload.message_id)
+        key = (payload.guild_id, payload.message_id)
+        if key in self._posts or await self._get_entry(*key):
+            # Its post shows the old text, so re-render it even though the star count hasn't moved
+            self._edited.add(key)
+            self._index_message(payload.message)
+            self._schedule_star_update(payload.guild_id, payload.channel_id, payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent) -> None:
+        self._recent_messages.pop(payload.message_id, None)
+        self._edited.discard((payload.guild_id, payload.message_id))
 
     @starboard_group.command(name="channel", description="Set the starboard channel (admin only)")
     @app_commands.describe(channel="The channel where starred messages will be posted")
@@ -169,15 +419,14 @@ class StarboardCog(commands.Cog):
             await inter.response.send_message("This command can only be used in a server.", ephemeral=True)
             return
 
-        await self.db.execute(
-            """
-            INSERT INTO starboard_config (guild_id, channel_id, threshold)
-            VALUES (?, ?, ?)
-            ON CONFLICT(guild_id) DO UPDATE SET channel_id = excluded.channel_id
-            """,
-            (inter.guild.id, channel.id, DEFAULT_THRESHOLD)
+        config = self._get_config(inter.guild.id)
+        await self.configs.set(
+            inter.guild.id,
+            channel_id=channel.id,
+            threshold=config["threshold"] if config else DEFAULT_THRESHOLD
         )
-        await self.db.commit()
+        # Cached posts belong to the previous starboard channel
+        self._posts.clear()
         await inter.response.send_message(
             f"Starboard channel set to {channel.mention}.",
             ephemeral=True
@@ -191,7 +440,7 @@ class StarboardCog(commands.Cog):
             await inter.response.send_message("This command can only be used in a server.", ephemeral=True)
             return
 
-        config = await self._get_config(inter.guild.id)
+        config = self._get_config(inter.guild.id)
         if not config:
             await inter.response.send_message(
                 "No starboard channel has been set. Use `/starboard channel` first.",
@@ -199,11 +448,7 @@ class StarboardCog(commands.Cog):
             )
             return
 
-        await self.db.execute(
-            "UPDATE starboard_config SET threshold = ? WHERE guild_id = ?",
-            (count, inter.guild.id)
-        )
-        await self.db.commit()
+        await self.configs.set(inter.guild.id, channel_id=config["channel_id"], threshold=count)
         await inter.response.send_message(
             f"Starboard threshold set to **{count}** {STAR_EMOJI}.",
             ephemeral=True
@@ -216,11 +461,7 @@ class StarboardCog(commands.Cog):
             await inter.response.send_message("This command can only be used in a server.", ephemeral=True)
             return
 
-        await self.db.execute(
-            "DELETE FROM starboard_config WHERE guild_id = ?",
-            (inter.guild.id,)
-        )
-        await self.db.commit()
+        await self.configs.delete(inter.guild.id)
         await inter.response.send_message("Starboard has been disabled for this server.", ephemeral=True)
 
     @starboard_group.command(name="status", description="Show the current starboard configuration")
@@ -229,7 +470,7 @@ class StarboardCog(commands.Cog):
             await inter.response.send_message("This command can only be used in a server.", ephemeral=True)
             return
 
-        config = await self._get_config(inter.guild.id)
+        config = self._get_config(inter.guild.id)
         if not config:
             await inter.response.send_message(
                 "Starboard is not configured. An admin can set it up with `/starboard channel`.",